@@ -1,5 +1,11 @@
 import asyncio
-from collections.abc import Callable
+import contextlib
+import hashlib
+import itertools
+import sys
+from collections import OrderedDict, deque
+from collections.abc import Container, Iterable, Iterator
+from dataclasses import dataclass, field
 from enum import StrEnum
 from pathlib import Path
 from typing import Annotated
@@ -8,17 +14,47 @@ import dotenv
 import typer
 from asyncer import runnify
 from loguru import logger
-from rich import print
+from pydantic import TypeAdapter
+from pydantic_ai.exceptions import ModelHTTPError
+from pydantic_core import from_json
+from rich.console import Console
+from rich.live import Live
+from rich.table import Table
 
 from hazmate.agent.agent import HazmatAgent
 from hazmate.agent.example_store import ExampleStore
 from hazmate.agent.labeled_items import HazmatLabeledItem
+from hazmate.agent.prediction_cache import PredictionCache
 from hazmate.agent.predictions import HazmatPrediction
 from hazmate.input_datasets.input_items import HazmatInputItem
+from hazmate.utils.rate_limit import AsyncRateLimiter
 from hazmate.utils.tokens import estimate_token_count
 
 app = typer.Typer()
 
+# Seconds between refreshes of the live status panel
+_STATUS_REFRESH_INTERVAL = 0.25
+
+# Input lines are validated in chunks of this size, which keeps pydantic-core's
+# list fast path while still streaming the input dataset
+_INPUT_CHUNK_SIZE = 256
+_INPUT_ITEMS_ADAPTER = TypeAdapter(list[HazmatInputItem])
+_LABELED_ITEMS_ADAPTER = TypeAdapter(list[HazmatLabeledItem])
+# Dumps straight to bytes, skipping the `str` round trip of `model_dump_json`
+_LABELED_ITEM_ADAPTER = TypeAdapter(HazmatLabeledItem)
+
+# Rate-limited (429) and server error (5xx) responses are retried in place with
+# exponential backoff, up to this many times, before the batch is given up on
+_MAX_RETRIES = 5
+
+# Serialized batches waiting to be written to the output file; the main loop
+# waits for the writer once this many are queued
+_MAX_PENDING_WRITES = 64
+
+# Predictions kept to answer later duplicates, least recently used first out;
+# duplicates of forgotten predictions are sent to the model again
+_MAX_REMEMBERED_PREDICTIONS = 10_000
+
 
 class OnExistingOutput(StrEnum):
     CONTINUE = "continue"
@@ -26,6 +62,77 @@ class OnExistingOutput(StrEnum):
     RAISE = "raise"
 
 
+@dataclass(slots=True)
+class _RunStatus:
+    """Counters shown in the live status panel while classifying."""
+
+    items_buffered: int = 0
+    pending_batches: int = 0
+    completed_items: int = 0
+
+    def __rich__(self) -> Table:
+        table = Table(title="Hazmat classification", show_header=False)
+        table.add_row("[cyan]Items buffered[/cyan]", str(self.items_buffered))
+        table.add_row("[cyan]Pending batches[/cyan]", str(self.pending_batches))
+        table.add_row("[green]Completed items[/green]", str(self.completed_items))
+        return table
+
+
+@dataclass(slots=True)
+class _DuplicateTracker:
+    """Send only one item per distinct content to the model.
+
+    Items are fingerprinted by their prompt content without the item ID. The
+    first item with a given fingerprint is classified as usual; later items
+    with the same fingerprint are held back and get a copy of its prediction.
+    Only the most recently used predictions are kept, so memory does not grow
+    with the size of the input dataset.
+    """
+
+    # Fingerprints of items sent to the model, by item ID
+    _fingerprints: dict[str, str] = field(default_factory=dict)
+    # Held-back items waiting on the prediction for their fingerprint
+    _duplicates: dict[str, list[HazmatInputItem]] = field(default_factory=dict)
+    # Recent predictions, by fingerprint, in least recently used order
+    _predictions: OrderedDict[str, HazmatPrediction] = field(
+        default_factory=OrderedDict
+    )
+    # Duplicates whose prediction was already known when they were read
+    _resolved: list[HazmatLabeledItem] = field(default_factory=list)
+
+    def filter(self, items: Iterable[HazmatInputItem]) -> Iterator[HazmatInputItem]:
+        """Yield the items that need to be sent to the model."""
+        for item in items:
+            fingerprint = _content_fingerprint(item)
+            if (prediction := self._predictions.get(fingerprint)) is not None:
+                self._predictions.move_to_end(fingerprint)
+                self._resolved.append(_label_duplicate(item, prediction))
+            elif (duplicates := self._duplicates.get(fingerprint)) is not None:
+                duplicates.append(item)
+            else:
+                self._fingerprints[item.item_id] = fingerprint
+                self._duplicates[fingerprint] = []
+                yield item
+
+    def resolve(self, results: Iterable[HazmatLabeledItem]) -> list[HazmatLabeledItem]:
+        """Get the labeled duplicates that can be emitted given new results."""
+        resolved, self._resolved = self._resolved, []
+        for result in results:
+            fingerprint = self._fingerprints.pop(result.item_id, None)
+            if fingerprint is None:
+                continue
+
+            prediction = result.prediction
+            self._predictions[fingerprint] = prediction
+            if len(self._predictions) > _MAX_REMEMBERED_PREDICTIONS:
+                self._predictions.popitem(last=False)
+            resolved.extend(
+                _label_duplicate(item, prediction)
+                for item in self._duplicates.pop(fingerprint)
+            )
+        return resolved
+
+
 @app.command()
 @runnify
 async def main(
@@ -109,125 +216,354 @@ async def main(
             help="Number of batches to process in parallel",
         ),
     ] = 1,
+    requests_per_minute: Annotated[
+        float | None,
+        typer.Option(
+            "--requests-per-minute",
+            help=(
+                "Maximum number of agent runs to start per minute, across all parallel batches."
+                " Each packed shard, single-item request and retry counts as one run."
+                " If not provided, runs are not rate limited."
+            ),
+        ),
+    ] = None,
+    prediction_cache_path: Annotated[
+        Path | None,
+        typer.Option(
+            "--prediction-cache",
+            help=(
+                "Path to a SQLite file caching predictions across runs."
+                " Items whose content was already classified with the same model and system prompt are not sent to the model again."
+            ),
+        ),
+    ] = None,
 ):
     if on_existing_output == OnExistingOutput.RAISE and output.exists():
         raise FileExistsError(f"Output file {output} already exists")
 
     dotenv.load_dotenv()
 
-    if examples is not None:
-        logger.info(f"Loading examples from {examples}")
-        example_store = ExampleStore.from_embedding_model_name_and_persist_directory(
-            persist_directory=examples.parent,
-            embedding_model_name=embedding_model_name,
+    # Resources opened below are closed when the run ends, even on failure
+    async with contextlib.AsyncExitStack() as exit_stack:
+        prediction_cache = (
+            exit_stack.enter_context(PredictionCache.from_path(prediction_cache_path))
+            if prediction_cache_path is not None
+            else None
         )
-        with examples.open() as f:
-            example_store.add_batch(
-                [HazmatLabeledItem.model_validate_json(line) for line in f]
+
+        rate_limiter = (
+            AsyncRateLimiter(max_rate=requests_per_minute, time_period=60)
+            if requests_per_minute is not None
+            else None
+        )
+
+        if examples is not None:
+            logger.info(f"Loading examples from {examples}")
+            example_store = (
+                ExampleStore.from_embedding_model_name_and_persist_directory(
+                    persist_directory=examples.parent,
+                    embedding_model_name=embedding_model_name,
+                )
             )
-        agent = HazmatAgent.from_model(model_name, example_store=example_store)
-    else:
-        logger.info("No examples provided, initializing agent without example store")
-        agent = HazmatAgent.from_model(model_name)
-
-    with input.open() as f:
-        items = [HazmatInputItem.model_validate_json(line) for line in f]
-
-    items_to_process = list(items)
-
-    # Handle existing output file
-    if on_existing_output == OnExistingOutput.CONTINUE and output.exists():
-        logger.info(f"Loading existing results from {output}")
-
-        processed_item_ids = set()
-        with output.open() as f:
-            for line in f:
-                existing_result = HazmatPrediction.model_validate_json(line)
-                processed_item_ids.add(existing_result.item_id)
-
-        logger.info(f"Found {len(processed_item_ids)} already processed items")
-        items_to_process = [
-            item for item in items_to_process if item.item_id not in processed_item_ids
-        ]
-        logger.info(f"Filtered to {len(items_to_process)} items still to process")
-
-    output.parent.mkdir(parents=True, exist_ok=True)
-    file_mode = "a" if on_existing_output == OnExistingOutput.CONTINUE else "w"
-    logger.info(f"Opening output file in '{file_mode}' mode")
-
-    tasks: set[asyncio.Task] = set()
-    with output.open(file_mode) as f:
-        while items_to_process or tasks:
-            print(f"[cyan]Items to process:[/cyan] {len(items_to_process)}")
-            print(f"[cyan]Pending tasks:[/cyan] {len(tasks)}")
-
-            while items_to_process and len(tasks) < parallel_batches:
-                batch = _extract_batch(
-                    items_to_process,
-                    batch_size=batch_size,
-                    max_input_tokens=max_input_tokens,
-                    batch_token_estimator=lambda batch: estimate_token_count(
-                        agent.get_user_prompt_for_batch(batch),
-                        "overestimate",
-                    ),
+            await example_store.aadd_batch(
+                _LABELED_ITEMS_ADAPTER.validate_json(
+                    b"[" + b",".join(examples.read_bytes().splitlines()) + b"]"
                 )
-                tasks.add(asyncio.create_task(_process_batch(agent=agent, batch=batch)))
-
-            done, tasks = await asyncio.wait(
-                tasks,
-                return_when=asyncio.FIRST_COMPLETED,
             )
+            agent = HazmatAgent.from_model(
+                model_name,
+                example_store=example_store,
+                prediction_cache=prediction_cache,
+                rate_limiter=rate_limiter,
+            )
+        else:
+            logger.info(
+                "No examples provided, initializing agent without example store"
+            )
+            agent = HazmatAgent.from_model(
+                model_name,
+                prediction_cache=prediction_cache,
+                rate_limiter=rate_limiter,
+            )
+        await exit_stack.enter_async_context(agent)
+
+        # Handle existing output file
+        processed_item_ids: set[str] = set()
+        if on_existing_output == OnExistingOutput.CONTINUE and output.exists():
+            logger.info(f"Loading existing results from {output}")
+
+            # Only the item IDs are needed here, so skip validating full predictions
+            with output.open("rb") as existing_output:
+                processed_item_ids = {
+                    from_json(line)["item_id"] for line in existing_output
+                }
+
+            logger.info(f"Found {len(processed_item_ids)} already processed items")
+
+        # Items are read lazily and only buffered a batch at a time, so memory
+        # does not grow with the size of the input dataset.
+        duplicate_tracker = _DuplicateTracker()
+        input_items = duplicate_tracker.filter(
+            _iter_input_items(input, skip_item_ids=processed_item_ids)
+        )
+        items_to_process: deque[HazmatInputItem] = deque()
+
+        # Item token counts are cheap to estimate once an item's XML is cached;
+        # the fixed part of the batch prompt is measured only once.
+        prompt_overhead_tokens = estimate_token_count(
+            agent.get_user_prompt_for_batch([]),
+            "overestimate",
+        )
 
-            for task in done:
-                batch, results = task.result()
-                processed_ids = {result.item_id for result in results}
-                print(f"    [blue]Processed IDs:[/blue] {processed_ids}")
-                # Re-add items that were not processed
-                items_to_process.extend(
-                    item for item in batch if item.item_id not in processed_ids
+        output.parent.mkdir(parents=True, exist_ok=True)
+        file_mode = "ab" if on_existing_output == OnExistingOutput.CONTINUE else "wb"
+        logger.info(f"Opening output file in '{file_mode}' mode")
+
+        # A fixed pool of long-lived workers pulls batches from `batches_to_process`
+        # and pushes results onto `completed_batches` as soon as they finish. This
+        # loop is the only producer of batches, so it can refill a free slot right
+        # away and re-queue failed items. Results are handed off to a single writer
+        # task, which keeps disk I/O off the loop and preserves the output order.
+        batches_to_process: asyncio.Queue[list[HazmatInputItem]] = asyncio.Queue()
+        completed_batches: asyncio.Queue[
+            tuple[list[HazmatInputItem], list[HazmatLabeledItem]]
+        ] = asyncio.Queue()
+        batches_to_write: asyncio.Queue[bytes | None] = asyncio.Queue(
+            maxsize=_MAX_PENDING_WRITES
+        )
+
+        # Status is rendered from a single panel refreshed at a fixed interval,
+        # instead of printing on every iteration of the loop
+        status = _RunStatus()
+
+        async def worker() -> None:
+            while True:
+                batch = await batches_to_process.get()
+                completed_batches.put_nowait(
+                    await _process_batch(agent=agent, batch=batch)
                 )
-                for result in results:
-                    f.write(result.model_dump_json() + "\n")
+
+        with (
+            output.open(file_mode) as f,
+            Live(status, auto_refresh=False) as live,
+            _log_to_console(live.console),
+        ):
+
+            async def writer() -> None:
+                while (data := await batches_to_write.get()) is not None:
+                    await asyncio.to_thread(f.write, data)
+
+            async def write_results(results: list[HazmatLabeledItem]) -> None:
+                status.completed_items += len(results)
+                # Serialize the whole batch first so it is written with a single call
+                await batches_to_write.put(
+                    b"".join(
+                        _LABELED_ITEM_ADAPTER.dump_json(result) + b"\n"
+                        for result in results
+                    )
+                )
+
+            async def refresher() -> None:
+                while True:
+                    live.refresh()
+                    await asyncio.sleep(_STATUS_REFRESH_INTERVAL)
+
+            async with asyncio.TaskGroup() as tg:
+                workers = [tg.create_task(worker()) for _ in range(parallel_batches)]
+                workers.append(tg.create_task(refresher()))
+                tg.create_task(writer())
+
+                while True:
+                    while status.pending_batches < parallel_batches:
+                        # Top up the buffer from the input stream
+                        if len(items_to_process) < batch_size:
+                            items_to_process.extend(
+                                itertools.islice(
+                                    input_items, batch_size - len(items_to_process)
+                                )
+                            )
+                        if not items_to_process:
+                            break
+
+                        # Token estimation renders each item, so keep it off the
+                        # event loop while other batches are in flight
+                        batch = await asyncio.to_thread(
+                            _extract_batch,
+                            items_to_process,
+                            batch_size=batch_size,
+                            max_input_tokens=max_input_tokens,
+                            prompt_overhead_tokens=prompt_overhead_tokens,
+                        )
+                        if not batch:
+                            # All the items taken were too large and skipped
+                            continue
+                        batches_to_process.put_nowait(batch)
+                        status.pending_batches += 1
+
+                    if not status.pending_batches:
+                        break
+
+                    status.items_buffered = len(items_to_process)
+
+                    batch, results = await completed_batches.get()
+                    status.pending_batches -= 1
+
+                    processed_ids = {result.item_id for result in results}
+                    logger.debug(f"Processed IDs: {processed_ids}")
+                    # Re-add items that were not processed to the front of the
+                    # queue, in their original order, so they are retried first
+                    items_to_process.extendleft(
+                        reversed(
+                            [
+                                item
+                                for item in batch
+                                if item.item_id not in processed_ids
+                            ]
+                        )
+                    )
+                    await write_results([*results, *duplicate_tracker.resolve(results)])
+
+                # Duplicates read after the last batch was sent are still pending
+                await write_results(duplicate_tracker.resolve([]))
+
+                # Let the writer drain the remaining batches before the file is closed
+                await batches_to_write.put(None)
+                for task in workers:
+                    task.cancel()
+
+
+@contextlib.contextmanager
+def _log_to_console(console: Console) -> Iterator[None]:
+    """Print log messages through a console, so they appear above its live display."""
+    logger.remove()
+    handler_id = logger.add(
+        lambda message: console.print(message, end="", markup=False, highlight=False)
+    )
+    try:
+        yield
+    finally:
+        logger.remove(handler_id)
+        logger.add(sys.stderr)
 
 
 async def _process_batch(
     agent: HazmatAgent,
     batch: list[HazmatInputItem],
 ) -> tuple[list[HazmatInputItem], list[HazmatLabeledItem]]:
-    try:
-        print(f"[green]Classifying batch of {len(batch)} items...[/green]")
-        result = await agent.classify_batch(
-            batch,
-            allow_mismatched_predictions=True,
-        )
-        return batch, result
-    except Exception as e:
-        logger.error(f"Error processing batch - trying again: {e}")
-        return batch, []
+    attempt = 0
+    while True:
+        try:
+            logger.debug(f"Classifying batch of {len(batch)} items")
+            result = await agent.classify_batch(
+                batch,
+                allow_mismatched_predictions=True,
+            )
+            return batch, result
+        except ModelHTTPError as e:
+            if not _is_retryable_status(e.status_code) or attempt == _MAX_RETRIES:
+                logger.error(f"Error processing batch - trying again later: {e}")
+                return batch, []
+
+            delay = 2**attempt
+            attempt += 1
+            logger.warning(
+                f"Model returned status {e.status_code} - retrying batch in {delay}s"
+            )
+            await asyncio.sleep(delay)
+        except Exception as e:
+            logger.error(f"Error processing batch - trying again: {e}")
+            return batch, []
+
+
+def _is_retryable_status(status_code: int) -> bool:
+    """Whether a failed request is worth retrying after backing off."""
+    return status_code == 429 or status_code >= 500
+
+
+def _iter_input_items(
+    path: Path,
+    skip_item_ids: Container[str],
+) -> Iterator[HazmatInputItem]:
+    """Lazily read the input dataset, skipping items that were already processed."""
+    # Validate straight from the raw bytes, a chunk of lines at a time: joining
+    # the lines into a JSON array lets pydantic-core validate the whole chunk in
+    # one call instead of once per line.
+    with path.open("rb") as f:
+        while lines := list(itertools.islice(f, _INPUT_CHUNK_SIZE)):
+            for item in _INPUT_ITEMS_ADAPTER.validate_json(
+                b"[" + b",".join(lines) + b"]"
+            ):
+                if item.item_id not in skip_item_ids:
+                    yield item
+
+
+def _content_fingerprint(item: HazmatInputItem) -> str:
+    """Fingerprint the content the model sees for an item, ignoring its ID."""
+    return hashlib.sha256(
+        item.get_all_text_content_as_xml(include_item_id=False).encode()
+    ).hexdigest()
+
+
+def _label_duplicate(
+    item: HazmatInputItem,
+    prediction: HazmatPrediction,
+) -> HazmatLabeledItem:
+    """Label an item with the prediction made for another item with the same content."""
+    return HazmatLabeledItem.from_input_and_prediction(
+        input_item=item,
+        prediction=prediction.model_copy(update={"item_id": item.item_id}),
+    )
+
+
+def _estimate_item_token_count(item: HazmatInputItem) -> int:
+    """Estimate the tokens an item adds to a batch prompt, including its separator."""
+    return estimate_token_count(
+        item.get_all_text_content_as_xml() + "\n",
+        "overestimate",
+    )
 
 
 def _extract_batch(
-    items_to_process: list[HazmatInputItem],
+    items_to_process: deque[HazmatInputItem],
     batch_size: int,
     max_input_tokens: int,
-    batch_token_estimator: Callable[[list[HazmatInputItem]], int],
+    prompt_overhead_tokens: int,
 ) -> list[HazmatInputItem]:
-    items_to_batch = min(batch_size, len(items_to_process))
-    batch = [items_to_process.pop() for _ in range(items_to_batch)]
+    """Take items from the front of the queue while the batch fits the token budget.
 
-    while (estimated_token_count := batch_token_estimator(batch)) > max_input_tokens:
-        if len(batch) == 1:
-            raise ValueError(
-                f"Batch of {len(batch)} items is too large, and cannot be reduced further"
-            )
-        logger.warning(
-            f"Estimated token count of {estimated_token_count} exceeds max input tokens of {max_input_tokens}"
-        )
-        logger.info(
-            f"Batch of {len(batch)} items is too large, reducing to {len(batch) // 2}"
-        )
-        items_to_process.extend(batch[: len(batch) // 2])
-        batch = batch[len(batch) // 2 :]
+    Items are packed greedily: each item is added to the batch as long as the
+    batch has fewer than `batch_size` items and the estimated token count of
+    the batch prompt stays within `max_input_tokens`. The batch is closed at the
+    first item that does not fit, which then starts the next batch. Only an
+    item too large for a batch of its own is sent without its attributes and
+    main features, the least important part of the prompt, and it is skipped if
+    it still does not fit.
+    """
+    batch: list[HazmatInputItem] = []
+    batch_token_count = prompt_overhead_tokens
+
+    while items_to_process and len(batch) < batch_size:
+        item = items_to_process[0]
+        item_token_count = _estimate_item_token_count(item)
+        if batch_token_count + item_token_count > max_input_tokens:
+            if batch:
+                break
+
+            item = item.without_attributes()
+            item_token_count = _estimate_item_token_count(item)
+            if batch_token_count + item_token_count > max_input_tokens:
+                items_to_process.popleft()
+                logger.error(
+                    f"Skipping item {item.item_id}, which is too large to fit in a batch:"
+                    f" estimated token count of {batch_token_count + item_token_count}"
+                    f" exceeds max input tokens of {max_input_tokens}"
+                )
+                continue
+            logger.warning(f"Dropped attributes from item {item.item_id} to fit batch")
+
+        items_to_process.popleft()
+        batch.append(item)
+        batch_token_count += item_token_count
 
     return batch
 
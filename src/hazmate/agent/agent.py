@@ -4,20 +4,123 @@ This module provides a straightforward implementation using PydanticAI
 for hazmat detection with optional RAG tooling.
 """
 
-from collections.abc import Sequence
-from dataclasses import dataclass
+import asyncio
+import functools
+import hashlib
+import itertools
+from collections.abc import AsyncIterator, Iterable, Mapping, Sequence
+from dataclasses import dataclass, field, replace
 from typing import Literal, Self, assert_never
 
+import httpx
+from asyncer import asyncify
 from loguru import logger
 from pydantic_ai import Agent, RunContext
-from pydantic_ai.models import Model
-
+from pydantic_ai.models import Model, infer_model
+from pydantic_ai.models.anthropic import AnthropicModel
+from pydantic_ai.models.openai import OpenAIModel
+from pydantic_ai.providers.anthropic import AnthropicProvider
+from pydantic_ai.providers.openai import OpenAIProvider
+from pydantic_ai.settings import ModelSettings
+
+from hazmate.agent.batch_api import predict_with_batch_api
 from hazmate.agent.example_store import ExampleStore
 from hazmate.agent.labeled_items import HazmatLabeledItem, MismatchedItemIdsError
+from hazmate.agent.prediction_cache import PredictionCache
 from hazmate.agent.predictions import HazmatPrediction
 from hazmate.input_datasets.input_items import HazmatInputItem
+from hazmate.utils.rate_limit import AsyncRateLimiter
 from hazmate.utils.text import clean_text
 
+_DEFAULT_EXAMPLE_COUNT = 3
+
+type BatchMode = Literal["packed", "fanout", "batch_api"]
+
+_BASE_SYSTEM_PROMPT = clean_text(
+    """
+    You are a hazardous materials (Hazmat) classification expert. Your job is to analyze product information and determine if items contain hazardous materials that require special handling during shipping.
+
+    Hazardous materials include but are not limited to:
+
+    - Flammable liquids, solids, and gases
+    - Explosive materials and fireworks
+    - Corrosive substances (acids, bases)
+    - Toxic or poisonous materials
+    - Radioactive materials
+    - Compressed gases
+    - Oxidizing agents
+    - Infectious substances
+    - Materials harmful to aquatic life
+
+    Consider the following factors:
+
+    1. Product name and description
+    2. Chemical composition or ingredients
+    3. Physical properties mentioned
+    4. Intended use or application
+    5. Safety warnings or precautions
+    6. Regulatory classifications mentioned
+
+    Be conservative in your classification - when in doubt about potential hazards, classify as hazmat for safety.
+
+    Example hazard traits to identify: "flammable", "explosive", "corrosive", "toxic", "compressed_gas", "oxidizing", "radioactive", "infectious", "irritant", "carcinogenic", "environmental_hazard"
+    """
+)
+
+_RAG_INSTRUCTIONS = clean_text(
+    """
+    ENHANCED CLASSIFICATION WITH EXAMPLES:
+    You have access to a knowledge base of previously classified products through the retrieve_similar_examples tool.
+
+    CLASSIFICATION PROCESS:
+    1. First, use the retrieve_similar_examples tool, passing the complete item information
+    2. Analyze the product information considering the factors above
+    3. Compare with the similar examples found
+    4. Make your classification decision based on both the product analysis and similar examples
+    5. Provide a clear justification that references the similar examples when relevant
+
+    IMPORTANT: Always use the retrieve_similar_examples tool before making your final decision.
+    """
+)
+
+# The output schema is fixed, so it is generated once at import time
+_OUTPUT_INSTRUCTIONS = clean_text(
+    """
+    Output schema:
+    {output_schema}
+
+    Always provide a clear, comprehensive justification for your decision.
+    IMPORTANT: Always include the item_id in your response to maintain traceability.
+    """
+).format(output_schema=HazmatPrediction.model_json_schema())
+
+# User prompt templates, cleaned once instead of on every request
+_ITEM_PROMPT_TEMPLATE = clean_text(
+    """
+    Analyze the following product information and classify whether it contains hazardous materials:
+
+    {item_data}
+    """
+)
+
+_BATCH_PROMPT_TEMPLATE = clean_text(
+    """
+    Analyze the following product information and classify each item as containing hazardous materials or not.
+
+    {item_data}
+    """
+)
+
+_BATCH_PROMPT_WITH_IDS_TEMPLATE = clean_text(
+    """
+    Analyze the following product information and classify each item as containing hazardous materials or not.
+
+    {item_data}
+
+    For each input item above, you must provide a classification result with the corresponding item_id.
+    """
+)
+
 
 class MismatchedPredictionsError(ValueError):
     """Error raised when predictions are missing for some items."""
@@ -35,6 +138,10 @@ class HazmatPredictionDeps:
     """Dependencies for the hazmat prediction agent."""
 
     example_store: ExampleStore | None = None
+    prefetched_examples: Mapping[tuple[str, int], list[HazmatLabeledItem]] = field(
+        default_factory=dict
+    )
+    """Examples retrieved ahead of a run, keyed by `(item_id, count)`."""
 
 
 @dataclass(frozen=True)
@@ -43,25 +150,51 @@ class HazmatAgent:
 
     agent: Agent[HazmatPredictionDeps, HazmatPrediction]
     deps: HazmatPredictionDeps
+    prediction_cache: PredictionCache | None = None
+    rate_limiter: AsyncRateLimiter | None = None
+    http_client: httpx.AsyncClient | None = None
+    """Client owned by the agent, closed by `aclose`."""
 
     @classmethod
     def from_model(
         cls,
         model_name: str | Model,
         example_store: ExampleStore | None = None,
+        cache_system_prompt: bool = True,
+        prediction_cache: PredictionCache | None = None,
+        max_connections: int | None = None,
+        rate_limiter: AsyncRateLimiter | None = None,
     ) -> Self:
         """Create an agent from a model name with optional RAG functionality.
 
         Args:
             model_name: Model to use for predictions
             example_store: Optional example store for RAG functionality
+            cache_system_prompt: Whether to ask the provider to cache the system
+                prompt, which is the stable prefix shared by every request
+            prediction_cache: Optional cache of predictions for previously
+                classified item contents, checked before calling the model
+            max_connections: Size of the HTTP connection pool used to reach the
+                model provider, which should be at least the number of concurrent
+                requests. If not provided, PydanticAI's shared default client is used.
+                Otherwise, the agent owns a client that must be closed with
+                `aclose`, or by using the agent as an async context manager.
+            rate_limiter: Optional limiter acquired before every agent run, so each
+                packed shard, single-item request and retry counts once
         """
+        model, http_client = _infer_model(model_name, max_connections=max_connections)
+        system_prompt = cls.get_system_prompt(
+            include_examples_rag=example_store is not None
+        )
         agent = Agent(
-            model_name,
+            model,
             deps_type=HazmatPredictionDeps,
             output_type=HazmatPrediction,
-            system_prompt=cls.get_system_prompt(
-                include_examples_rag=example_store is not None
+            system_prompt=system_prompt,
+            model_settings=(
+                _get_prompt_caching_settings(model, system_prompt)
+                if cache_system_prompt
+                else None
             ),
         )
 
@@ -69,7 +202,24 @@ class HazmatAgent:
         if example_store is not None:
             cls._register_example_retrieval_tool(agent)
 
-        return cls(agent=agent, deps=HazmatPredictionDeps(example_store=example_store))
+        return cls(
+            agent=agent,
+            deps=HazmatPredictionDeps(example_store=example_store),
+            prediction_cache=prediction_cache,
+            rate_limiter=rate_limiter,
+            http_client=http_client,
+        )
+
+    async def __aenter__(self) -> Self:
+        return self
+
+    async def __aexit__(self, *exc_info: object) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        """Close the HTTP client created for the model's connection pool, if any."""
+        if self.http_client is not None:
+            await self.http_client.aclose()
 
     @classmethod
     def _register_example_retrieval_tool(
@@ -81,7 +231,7 @@ class HazmatAgent:
         async def retrieve_similar_examples(
             ctx: RunContext[HazmatPredictionDeps],
             item: HazmatInputItem,
-            count: int = 3,
+            count: int = _DEFAULT_EXAMPLE_COUNT,
         ) -> str:
             """Retrieve similar hazmat classification examples to help with decision making.
 
@@ -96,8 +246,13 @@ class HazmatAgent:
             if ctx.deps.example_store is None:
                 return "No example store available for similarity search."
 
-            # Use the item directly for similarity search
-            similar_examples = ctx.deps.example_store.retrieve(item, count=count)
+            # Prefer examples fetched ahead of the run, falling back to a
+            # similarity search for items or counts that were not prefetched
+            similar_examples = ctx.deps.prefetched_examples.get((item.item_id, count))
+            if similar_examples is None:
+                similar_examples = await ctx.deps.example_store.aretrieve(
+                    item, count=count
+                )
 
             if not similar_examples:
                 return "No similar examples found in the knowledge base."
@@ -122,68 +277,18 @@ class HazmatAgent:
             return "\n\n".join(formatted_examples)
 
     @classmethod
+    @functools.cache
     def get_system_prompt(cls, include_examples_rag: bool = False) -> str:
-        """Get the system prompt for the agent."""
-        base_prompt = clean_text(
-            """
-            You are a hazardous materials (Hazmat) classification expert. Your job is to analyze product information and determine if items contain hazardous materials that require special handling during shipping.
-
-            Hazardous materials include but are not limited to:
-
-            - Flammable liquids, solids, and gases
-            - Explosive materials and fireworks
-            - Corrosive substances (acids, bases)
-            - Toxic or poisonous materials
-            - Radioactive materials
-            - Compressed gases
-            - Oxidizing agents
-            - Infectious substances
-            - Materials harmful to aquatic life
-
-            Consider the following factors:
-
-            1. Product name and description
-            2. Chemical composition or ingredients
-            3. Physical properties mentioned
-            4. Intended use or application
-            5. Safety warnings or precautions
-            6. Regulatory classifications mentioned
-
-            Be conservative in your classification - when in doubt about potential hazards, classify as hazmat for safety.
-
-            Example hazard traits to identify: "flammable", "explosive", "corrosive", "toxic", "compressed_gas", "oxidizing", "radioactive", "infectious", "irritant", "carcinogenic", "environmental_hazard"
-            """
-        )
+        """Get the system prompt for the agent.
 
+        The prompt only depends on `include_examples_rag`, so it is built once per
+        value and cached.
+        """
         if include_examples_rag:
-            rag_instructions = clean_text(
-                """
-                    ENHANCED CLASSIFICATION WITH EXAMPLES:
-                    You have access to a knowledge base of previously classified products through the retrieve_similar_examples tool.
-
-                    CLASSIFICATION PROCESS:
-                    1. First, use the retrieve_similar_examples tool, passing the complete item information
-                    2. Analyze the product information considering the factors above
-                    3. Compare with the similar examples found
-                    4. Make your classification decision based on both the product analysis and similar examples
-                    5. Provide a clear justification that references the similar examples when relevant
-
-                    IMPORTANT: Always use the retrieve_similar_examples tool before making your final decision.
-                """
+            return "\n\n".join(
+                (_BASE_SYSTEM_PROMPT, _RAG_INSTRUCTIONS, _OUTPUT_INSTRUCTIONS)
             )
-            base_prompt += "\n\n" + rag_instructions
-
-        base_prompt += "\n\n" + clean_text(
-            """
-                Output schema:
-                {output_schema}
-
-                Always provide a clear, comprehensive justification for your decision.
-                IMPORTANT: Always include the item_id in your response to maintain traceability.
-            """
-        ).format(output_schema=HazmatPrediction.model_json_schema())
-
-        return base_prompt
+        return "\n\n".join((_BASE_SYSTEM_PROMPT, _OUTPUT_INSTRUCTIONS))
 
     def get_user_prompt_for_item(
         self,
@@ -198,14 +303,7 @@ class HazmatAgent:
         )
 
         # Create the prompt for this specific item
-        prompt = clean_text(
-            """Analyze the following product information and classify whether it contains hazardous materials:
-
-                {item_data}
-            """
-        ).format(item_data=item_data)
-
-        return prompt
+        return _ITEM_PROMPT_TEMPLATE.format(item_data=item_data)
 
     def get_user_prompt_for_batch(
         self,
@@ -213,15 +311,14 @@ class HazmatAgent:
         include_attributes: bool = True,
     ) -> str:
         """Get the user prompt for a batch of items."""
-        return clean_text(
-            """Analyze the following product information and classify each item as containing hazardous materials or not.
-
-                {item_data}
-            """
-        ).format(
+        return _BATCH_PROMPT_TEMPLATE.format(
             item_data="\n".join(
-                item.get_all_text_content_as_xml(include_attributes=include_attributes)
-                for item in items
+                [
+                    item.get_all_text_content_as_xml(
+                        include_attributes=include_attributes
+                    )
+                    for item in items
+                ]
             )
         )
 
@@ -242,11 +339,18 @@ class HazmatAgent:
         Returns:
             HazmatPrediction with classification results
         """
+        cached_predictions, cache_keys = await self._get_cached_predictions(
+            [item], include_attributes=include_attributes
+        )
+        if cached_predictions:
+            return cached_predictions[0]
+
         prompt = self.get_user_prompt_for_item(
             item,
             include_item_id=include_item_id,
             include_attributes=include_attributes,
         )
+        await self._wait_for_rate_limit()
         result = await self.agent.run(
             prompt,
             deps=self.deps,
@@ -267,6 +371,7 @@ class HazmatAgent:
                 case never:
                     assert_never(never)
 
+        await self._cache_predictions([prediction], cache_keys)
         return prediction
 
     async def predict_batch(
@@ -275,43 +380,464 @@ class HazmatAgent:
         include_item_id: bool = True,
         include_attributes: bool = True,
         allow_mismatched_predictions: bool = False,
+        mode: BatchMode = "packed",
+        max_concurrency: int = 16,
+        window_size: int = 1000,
+        shard_size: int = 20,
+        max_parallel_shards: int = 4,
+        auto_recover: bool = True,
+        max_recovered_items: int = 5,
     ) -> list[HazmatPrediction]:
-        """Predict hazmat classification for multiple items in batch."""
-        prompt = clean_text(
-            """Analyze the following product information and classify each item as containing hazardous materials or not.
+        """Predict hazmat classification for multiple items in batch.
 
-                {item_data}
+        Args:
+            items: The input dataset items to classify
+            include_item_id: Whether to include item ID in the prompt
+            include_attributes: Whether to include attributes in the prompt
+            allow_mismatched_predictions: Whether to allow mismatched predictions
+            mode: Whether to pack all items into a single prompt ("packed"), to
+                send one request per item concurrently ("fanout"), or to submit one
+                request per item to the provider's offline batch API ("batch_api")
+            max_concurrency: Maximum number of concurrent requests in "fanout" mode
+            window_size: Maximum number of item tasks alive at once in "fanout" mode
+            shard_size: Maximum number of items per request in "packed" mode; larger
+                batches are split into shards sent as concurrent requests
+            max_parallel_shards: Maximum number of concurrent shard requests in
+                "packed" mode
+            auto_recover: Whether to re-request items missing from the predictions
+                one at a time, when there are at most `max_recovered_items` of them
+            max_recovered_items: Maximum number of missing items to re-request
+        """
+        # Items with identical content are only sent once; their prediction is
+        # copied to the duplicates afterwards
+        unique_items, duplicate_ids = _deduplicate_items(
+            items, include_attributes=include_attributes
+        )
+        if len(unique_items) < len(items):
+            logger.debug(
+                f"Sending {len(unique_items)} unique items out of {len(items)} in batch"
+            )
 
-                For each input item above, you must provide a classification result with the corresponding item_id.
-            """
-        ).format(
-            item_data="\n".join(
-                item.get_all_text_content_as_xml(
+        match mode:
+            case "packed":
+                predictions = await self._predict_batch_packed(
+                    unique_items,
                     include_item_id=include_item_id,
                     include_attributes=include_attributes,
+                    shard_size=shard_size,
+                    max_parallel_shards=max_parallel_shards,
                 )
-                for item in items
+            case "fanout":
+                predictions = await self._predict_batch_fanout(
+                    unique_items,
+                    include_item_id=include_item_id,
+                    include_attributes=include_attributes,
+                    max_concurrency=max_concurrency,
+                    window_size=window_size,
+                )
+            case "batch_api":
+                predictions = await self._predict_batch_with_batch_api(
+                    unique_items,
+                    include_item_id=include_item_id,
+                    include_attributes=include_attributes,
+                )
+            case never:
+                assert_never(never)
+
+        if auto_recover:
+            predictions.extend(
+                await self._recover_missing_predictions(
+                    unique_items,
+                    predictions,
+                    include_item_id=include_item_id,
+                    include_attributes=include_attributes,
+                    max_recovered_items=max_recovered_items,
+                )
+            )
+
+        predictions.extend(
+            prediction.model_copy(update={"item_id": item_id})
+            for prediction in list(predictions)
+            for item_id in duplicate_ids.get(prediction.item_id, ())
+        )
+
+        # Ensure we have predictions for all items and IDs are correctly set
+        if not allow_mismatched_predictions and not _predictions_match_items(
+            items, predictions
+        ):
+            raise MismatchedPredictionsError(
+                input_ids={item.item_id for item in items},
+                prediction_ids={pred.item_id for pred in predictions},
+            )
+
+        return predictions
+
+    async def predict_batch_iter(
+        self,
+        items: Iterable[HazmatInputItem],
+        include_item_id: bool = True,
+        include_attributes: bool = True,
+        max_concurrency: int = 16,
+    ) -> AsyncIterator[HazmatPrediction]:
+        """Predict each item with its own request, yielding predictions as they complete.
+
+        At most `max_concurrency` requests are in flight at once, and the next
+        item is only started when one finishes, so callers can write results
+        out while other requests are still running. Predictions are yielded in
+        completion order, not input order. Items whose request fails are logged
+        and skipped.
+
+        Args:
+            items: The input dataset items to classify
+            include_item_id: Whether to include item ID in the prompt
+            include_attributes: Whether to include attributes in the prompt
+            max_concurrency: Maximum number of concurrent requests
+        """
+
+        async def predict_one(item: HazmatInputItem) -> HazmatPrediction | None:
+            try:
+                return await self.predict_item(
+                    item,
+                    include_item_id=include_item_id,
+                    include_attributes=include_attributes,
+                    on_different_id="fix",
+                )
+            except Exception as e:
+                logger.warning(f"Failed to predict item {item.item_id}: {e}")
+                return None
+
+        items_iterator = iter(items)
+        pending: set[asyncio.Task[HazmatPrediction | None]] = set()
+
+        def start_next_items() -> None:
+            for item in itertools.islice(
+                items_iterator, max_concurrency - len(pending)
+            ):
+                pending.add(asyncio.create_task(predict_one(item)))
+
+        try:
+            start_next_items()
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                start_next_items()
+                for task in done:
+                    if (prediction := task.result()) is not None:
+                        yield prediction
+        finally:
+            # The caller may stop iterating early
+            for task in pending:
+                task.cancel()
+
+    async def _predict_batch_packed(
+        self,
+        items: Sequence[HazmatInputItem],
+        include_item_id: bool,
+        include_attributes: bool,
+        shard_size: int,
+        max_parallel_shards: int,
+    ) -> list[HazmatPrediction]:
+        """Predict items with requests that each list up to `shard_size` items.
+
+        Large batches are split into shards sent as concurrent requests, since
+        several short generations finish sooner than a single long one.
+        """
+        if len(items) <= shard_size:
+            return await self._predict_shard(
+                items,
+                include_item_id=include_item_id,
+                include_attributes=include_attributes,
             )
+
+        semaphore = asyncio.Semaphore(max_parallel_shards)
+
+        async def predict_shard(
+            shard: Sequence[HazmatInputItem],
+        ) -> list[HazmatPrediction]:
+            async with semaphore:
+                return await self._predict_shard(
+                    shard,
+                    include_item_id=include_item_id,
+                    include_attributes=include_attributes,
+                )
+
+        # A failed shard does not discard the others: its items are left out of
+        # the predictions, for `auto_recover` or the caller to retry. Only if
+        # every shard failed is the error raised.
+        shard_results = await asyncio.gather(
+            *(
+                predict_shard(items[start : start + shard_size])
+                for start in range(0, len(items), shard_size)
+            ),
+            return_exceptions=True,
+        )
+
+        predictions: list[HazmatPrediction] = []
+        errors: list[Exception] = []
+        for result in shard_results:
+            match result:
+                case list():
+                    predictions.extend(result)
+                case Exception():
+                    errors.append(result)
+                case _:
+                    raise result
+
+        if len(errors) == len(shard_results):
+            raise errors[0]
+        for error in errors:
+            logger.warning(f"Failed to predict a shard of the batch: {error}")
+        return predictions
+
+    async def _predict_shard(
+        self,
+        items: Sequence[HazmatInputItem],
+        include_item_id: bool,
+        include_attributes: bool,
+    ) -> list[HazmatPrediction]:
+        """Predict all items with a single request that lists every item."""
+        cached_predictions, cache_keys = await self._get_cached_predictions(
+            items, include_attributes=include_attributes
+        )
+        if self.prediction_cache is not None:
+            items = [item for item in items if item.item_id in cache_keys]
+            if not items:
+                return cached_predictions
+
+        # Rendering the items is CPU-bound, so do it in a worker thread to keep
+        # the event loop free for other batches' network I/O
+        prompt = await asyncio.to_thread(
+            _build_batch_prompt,
+            items,
+            include_item_id=include_item_id,
+            include_attributes=include_attributes,
         )
 
         # Run the agent
+        await self._wait_for_rate_limit()
         result = await self.agent.run(
             prompt,
-            deps=self.deps,
+            deps=await self._prefetch_examples(items),
             output_type=list[HazmatPrediction],
         )
-        predictions = result.output
+        await self._cache_predictions(result.output, cache_keys)
+        return cached_predictions + result.output
 
-        # Ensure we have predictions for all items and IDs are correctly set
-        item_ids = {item.item_id for item in items}
-        prediction_ids = {pred.item_id for pred in predictions}
-        if not allow_mismatched_predictions and prediction_ids != item_ids:
-            raise MismatchedPredictionsError(
-                input_ids=item_ids,
-                prediction_ids=prediction_ids,
+    async def _predict_batch_fanout(
+        self,
+        items: Sequence[HazmatInputItem],
+        include_item_id: bool,
+        include_attributes: bool,
+        max_concurrency: int,
+        window_size: int,
+    ) -> list[HazmatPrediction]:
+        """Predict each item with its own request, running up to `max_concurrency` at once.
+
+        At most `window_size` tasks exist at any time; a new one is started each
+        time one finishes, so large item lists do not create all their tasks up
+        front. Items whose request fails are logged and left out of the result.
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+        # Indexed by input position, so predictions keep the order of the items
+        predictions: list[HazmatPrediction | None] = [None] * len(items)
+
+        async def predict_one(index: int, item: HazmatInputItem) -> None:
+            async with semaphore:
+                try:
+                    predictions[index] = await self.predict_item(
+                        item,
+                        include_item_id=include_item_id,
+                        include_attributes=include_attributes,
+                        on_different_id="fix",
+                    )
+                except Exception as e:
+                    logger.warning(f"Failed to predict item {item.item_id}: {e}")
+
+        pending: set[asyncio.Task[None]] = set()
+        async with asyncio.TaskGroup() as tg:
+            for index, item in enumerate(items):
+                if len(pending) >= window_size:
+                    _, pending = await asyncio.wait(
+                        pending, return_when=asyncio.FIRST_COMPLETED
+                    )
+                pending.add(tg.create_task(predict_one(index, item)))
+
+        return [prediction for prediction in predictions if prediction is not None]
+
+    async def _predict_batch_with_batch_api(
+        self,
+        items: Sequence[HazmatInputItem],
+        include_item_id: bool,
+        include_attributes: bool,
+    ) -> list[HazmatPrediction]:
+        """Predict each item through the model provider's offline batch API.
+
+        This is much slower than the other modes, but cheaper, which suits bulk
+        labeling. The model cannot call tools in this mode, so it is not
+        available with an example store.
+        """
+        if self.deps.example_store is not None:
+            raise ValueError(
+                "The batch API mode does not support retrieving similar examples"
             )
 
-        return predictions
+        cached_predictions, cache_keys = await self._get_cached_predictions(
+            items, include_attributes=include_attributes
+        )
+        if self.prediction_cache is not None:
+            items = [item for item in items if item.item_id in cache_keys]
+
+        if self.agent.model is None:
+            raise ValueError("The batch API mode requires the agent to have a model")
+
+        predictions = await predict_with_batch_api(
+            infer_model(self.agent.model),
+            system_prompt=self.get_system_prompt(),
+            prompts={
+                item.item_id: self.get_user_prompt_for_item(
+                    item,
+                    include_item_id=include_item_id,
+                    include_attributes=include_attributes,
+                )
+                for item in items
+            },
+        )
+        await self._cache_predictions(predictions, cache_keys)
+        return cached_predictions + predictions
+
+    async def _recover_missing_predictions(
+        self,
+        items: Sequence[HazmatInputItem],
+        predictions: Sequence[HazmatPrediction],
+        include_item_id: bool,
+        include_attributes: bool,
+        max_recovered_items: int,
+    ) -> list[HazmatPrediction]:
+        """Predict items that are missing from a batch's predictions one at a time.
+
+        When only a few items are missing, re-requesting them individually is
+        much cheaper than redoing the whole batch. Nothing is recovered if more
+        than `max_recovered_items` items are missing.
+        """
+        predicted_ids = {prediction.item_id for prediction in predictions}
+        missing_items = [item for item in items if item.item_id not in predicted_ids]
+        if not missing_items or len(missing_items) > max_recovered_items:
+            return []
+
+        logger.info(f"Re-requesting {len(missing_items)} items missing from batch")
+        results = await asyncio.gather(
+            *(
+                self.predict_item(
+                    item,
+                    include_item_id=include_item_id,
+                    include_attributes=include_attributes,
+                    on_different_id="fix",
+                )
+                for item in missing_items
+            ),
+            return_exceptions=True,
+        )
+
+        recovered: list[HazmatPrediction] = []
+        for item, result in zip(missing_items, results, strict=True):
+            if isinstance(result, BaseException):
+                logger.warning(f"Failed to recover item {item.item_id}: {result}")
+            else:
+                recovered.append(result)
+        return recovered
+
+    async def _wait_for_rate_limit(self) -> None:
+        """Wait for the rate limiter, if any, before starting an agent run."""
+        if self.rate_limiter is not None:
+            await self.rate_limiter.acquire()
+
+    async def _get_cached_predictions(
+        self,
+        items: Sequence[HazmatInputItem],
+        include_attributes: bool,
+    ) -> tuple[list[HazmatPrediction], dict[str, str]]:
+        """Look up items in the prediction cache.
+
+        Returns the cached predictions, relabeled with each item's ID, and the
+        cache keys of the items that were not found, by item ID. Both are empty
+        if there is no prediction cache.
+        """
+        if self.prediction_cache is None:
+            return [], {}
+
+        model = self.agent.model
+        model_name = (
+            f"{model.system}:{model.model_name}"
+            if isinstance(model, Model)
+            else str(model)
+        )
+        system_prompt = self.get_system_prompt(
+            include_examples_rag=self.deps.example_store is not None
+        )
+        # The item ID is left out of the key so items with identical content
+        # share a cache entry
+        keys = {
+            item.item_id: PredictionCache.get_key(
+                model_name=model_name,
+                system_prompt=system_prompt,
+                item_content=item.get_all_text_content_as_xml(
+                    include_item_id=False,
+                    include_attributes=include_attributes,
+                ),
+            )
+            for item in items
+        }
+        cached = await asyncify(self.prediction_cache.get_many)(list(keys.values()))
+
+        predictions: list[HazmatPrediction] = []
+        missing_keys: dict[str, str] = {}
+        for item_id, key in keys.items():
+            if (prediction := cached.get(key)) is not None:
+                predictions.append(prediction.model_copy(update={"item_id": item_id}))
+            else:
+                missing_keys[item_id] = key
+        return predictions, missing_keys
+
+    async def _cache_predictions(
+        self,
+        predictions: Sequence[HazmatPrediction],
+        cache_keys: Mapping[str, str],
+    ) -> None:
+        """Store new predictions under the cache keys of their items."""
+        if self.prediction_cache is None:
+            return
+
+        await asyncify(self.prediction_cache.set_many)(
+            {
+                cache_keys[prediction.item_id]: prediction
+                for prediction in predictions
+                if prediction.item_id in cache_keys
+            }
+        )
+
+    async def _prefetch_examples(
+        self, items: Sequence[HazmatInputItem]
+    ) -> HazmatPredictionDeps:
+        """Retrieve examples for all items at once, ahead of the agent run.
+
+        This embeds the whole batch in a single call, so the per-item tool calls
+        made by the model during the run become dictionary lookups.
+        """
+        example_store = self.deps.example_store
+        if example_store is None or not items:
+            return self.deps
+
+        examples = await asyncify(example_store.retrieve_many)(
+            items, count=_DEFAULT_EXAMPLE_COUNT
+        )
+        return replace(
+            self.deps,
+            prefetched_examples={
+                (item.item_id, _DEFAULT_EXAMPLE_COUNT): item_examples
+                for item, item_examples in zip(items, examples, strict=True)
+            },
+        )
 
     async def classify_item(
         self,
@@ -346,6 +872,13 @@ class HazmatAgent:
         include_item_id: bool = True,
         include_attributes: bool = True,
         allow_mismatched_predictions: bool = False,
+        mode: BatchMode = "packed",
+        max_concurrency: int = 16,
+        window_size: int = 1000,
+        shard_size: int = 20,
+        max_parallel_shards: int = 4,
+        auto_recover: bool = True,
+        max_recovered_items: int = 5,
     ) -> list[HazmatLabeledItem]:
         """Classify multiple items and return combined input+prediction results.
 
@@ -354,22 +887,216 @@ class HazmatAgent:
             include_item_id: Whether to include item ID in the prompt
             include_attributes: Whether to include attributes in the prompt
             allow_mismatched_predictions: Whether to allow mismatched predictions
+            mode: Whether to pack all items into a single prompt ("packed"), to
+                send one request per item concurrently ("fanout"), or to submit one
+                request per item to the provider's offline batch API ("batch_api")
+            max_concurrency: Maximum number of concurrent requests in "fanout" mode
+            window_size: Maximum number of item tasks alive at once in "fanout" mode
+            shard_size: Maximum number of items per request in "packed" mode; larger
+                batches are split into shards sent as concurrent requests
+            max_parallel_shards: Maximum number of concurrent shard requests in
+                "packed" mode
+            auto_recover: Whether to re-request items missing from the predictions
+                one at a time, when there are at most `max_recovered_items` of them
+            max_recovered_items: Maximum number of missing items to re-request
         """
         predictions = await self.predict_batch(
             items,
             include_item_id=include_item_id,
             include_attributes=include_attributes,
             allow_mismatched_predictions=allow_mismatched_predictions,
+            mode=mode,
+            max_concurrency=max_concurrency,
+            window_size=window_size,
+            shard_size=shard_size,
+            max_parallel_shards=max_parallel_shards,
+            auto_recover=auto_recover,
+            max_recovered_items=max_recovered_items,
         )
 
-        inputs_map = {item.item_id: item for item in items}
+        # Predictions usually come back in input order, so pair them directly
+        if len(predictions) == len(items) and all(
+            prediction.item_id == item.item_id
+            for item, prediction in zip(items, predictions)
+        ):
+            return [
+                HazmatLabeledItem.from_input_and_prediction(
+                    input_item=item,
+                    prediction=prediction,
+                )
+                for item, prediction in zip(items, predictions, strict=True)
+            ]
+
         predictions_map = {pred.item_id: pred for pred in predictions}
 
         return [
             HazmatLabeledItem.from_input_and_prediction(
-                input_item=inputs_map[item_id],
-                prediction=predictions_map[item_id],
+                input_item=item,
+                prediction=prediction,
             )
-            for item_id in inputs_map
-            if item_id in predictions_map
+            for item in items
+            if (prediction := predictions_map.get(item.item_id)) is not None
         ]
+
+
+def _predictions_match_items(
+    items: Sequence[HazmatInputItem],
+    predictions: Sequence[HazmatPrediction],
+) -> bool:
+    """Whether the predictions cover exactly the IDs of the items.
+
+    This walks the predictions once and stops at the first unexpected ID; the
+    prediction ID set is only built when reporting a mismatch.
+    """
+    item_ids = {item.item_id for item in items}
+    missing_ids = set(item_ids)
+    for prediction in predictions:
+        if prediction.item_id not in item_ids:
+            return False
+        missing_ids.discard(prediction.item_id)
+    return not missing_ids
+
+
+def _deduplicate_items(
+    items: Sequence[HazmatInputItem],
+    include_attributes: bool,
+) -> tuple[list[HazmatInputItem], dict[str, list[str]]]:
+    """Drop items whose prompt content, ignoring the item ID, repeats an earlier item.
+
+    Returns the unique items and, for each of them that had duplicates, the IDs
+    of the dropped duplicates.
+    """
+    unique_items: list[HazmatInputItem] = []
+    representative_ids: dict[bytes, str] = {}
+    duplicate_ids: dict[str, list[str]] = {}
+
+    for item in items:
+        key = hashlib.blake2b(
+            item.get_all_text_content_as_xml(
+                include_item_id=False,
+                include_attributes=include_attributes,
+            ).encode(),
+            digest_size=16,
+        ).digest()
+        if (representative_id := representative_ids.get(key)) is None:
+            representative_ids[key] = item.item_id
+            unique_items.append(item)
+        elif item.item_id != representative_id:
+            duplicate_ids.setdefault(representative_id, []).append(item.item_id)
+
+    return unique_items, duplicate_ids
+
+
+def _build_batch_prompt(
+    items: Sequence[HazmatInputItem],
+    include_item_id: bool,
+    include_attributes: bool,
+) -> str:
+    """Build the user prompt for a batch of items, tagged with their IDs."""
+    return _BATCH_PROMPT_WITH_IDS_TEMPLATE.format(
+        # `str.join` builds a list from a generator anyway, so pass it one directly
+        item_data="\n".join(
+            [
+                item.get_all_text_content_as_xml(
+                    include_item_id=include_item_id,
+                    include_attributes=include_attributes,
+                )
+                for item in items
+            ]
+        )
+    )
+
+
+def _infer_model(
+    model_name: str | Model, max_connections: int | None
+) -> tuple[Model, httpx.AsyncClient | None]:
+    """Infer a model from its name, optionally with a dedicated connection pool.
+
+    Only OpenAI and Anthropic models get a dedicated pool; other providers keep
+    PydanticAI's default client. The dedicated client, if any, is returned with
+    the model so that its owner can close it.
+    """
+    if isinstance(model_name, Model) or max_connections is None:
+        return infer_model(model_name), None
+
+    match _split_model_name(model_name):
+        case ("openai", name):
+            http_client = _create_http_client(max_connections)
+            return OpenAIModel(
+                name, provider=OpenAIProvider(http_client=http_client)
+            ), http_client
+        case ("anthropic", name):
+            http_client = _create_http_client(max_connections)
+            return AnthropicModel(
+                name, provider=AnthropicProvider(http_client=http_client)
+            ), http_client
+        case _:
+            logger.warning(
+                f"Connection pool size is only configurable for OpenAI and Anthropic models, not {model_name}"
+            )
+            return infer_model(model_name), None
+
+
+def _split_model_name(model_name: str) -> tuple[str, str] | None:
+    """Split a model name into its provider and model, as PydanticAI's `infer_model` does.
+
+    Names without a provider prefix are resolved from the model name for the
+    OpenAI and Anthropic models; `None` is returned for other bare names.
+    """
+    if ":" in model_name:
+        provider, name = model_name.split(":", maxsplit=1)
+        return provider, name
+    if model_name.startswith(("gpt", "o1", "o3")):
+        return "openai", model_name
+    if model_name.startswith("claude"):
+        return "anthropic", model_name
+    return None
+
+
+def _create_http_client(max_connections: int) -> httpx.AsyncClient:
+    """Create an HTTP client with a connection pool of the given size."""
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+        ),
+        # Same timeouts as PydanticAI's default client
+        timeout=httpx.Timeout(timeout=600, connect=5),
+    )
+
+
+def _get_prompt_caching_settings(
+    model: Model, system_prompt: str
+) -> ModelSettings | None:
+    """Get model settings that let the provider cache the shared system prompt.
+
+    Every request starts with the same system prompt, so providers that support
+    prompt caching can bill and process it as a cached prefix:
+
+    - Anthropic only caches prefixes explicitly marked with `cache_control`, so
+      the system prompt is resent as a single cacheable text block.
+    - OpenAI caches long prefixes automatically; a stable `prompt_cache_key`
+      derived from the system prompt improves cache hit rates across requests.
+
+    Other providers (including OpenAI-compatible servers) get no extra settings.
+    """
+    match model.system:
+        case "anthropic":
+            return ModelSettings(
+                extra_body={
+                    "system": [
+                        {
+                            "type": "text",
+                            "text": system_prompt,
+                            "cache_control": {"type": "ephemeral"},
+                        }
+                    ]
+                }
+            )
+        case "openai" if model.base_url and "api.openai.com" in model.base_url:
+            system_prompt_hash = hashlib.sha256(system_prompt.encode()).hexdigest()
+            return ModelSettings(
+                extra_body={"prompt_cache_key": f"hazmate-{system_prompt_hash[:16]}"}
+            )
+        case _:
+            return None
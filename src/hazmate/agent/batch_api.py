@@ -0,0 +1,241 @@
+"""Offline classification through the providers' asynchronous batch APIs.
+
+OpenAI and Anthropic process batch requests within 24 hours at a discount,
+which suits bulk labeling runs where latency does not matter. Each item is sent
+as an independent request and the results are matched back by item ID.
+"""
+
+import asyncio
+import json
+from collections.abc import Mapping
+from typing import Final
+
+from loguru import logger
+from pydantic import ValidationError
+from pydantic_ai.models import Model
+from pydantic_ai.models.anthropic import AnthropicModel
+from pydantic_ai.models.openai import OpenAIModel
+
+from hazmate.agent.predictions import HazmatPrediction
+
+# Both providers take minutes to hours to process a batch, so there is no point
+# in polling more often than this
+DEFAULT_POLL_INTERVAL = 30.0
+
+_OPENAI_ENDPOINT: Final = "/v1/chat/completions"
+_OPENAI_FINAL_STATUSES = frozenset({"completed", "failed", "expired", "cancelled"})
+
+_ANTHROPIC_MAX_TOKENS = 1024
+_PREDICTION_TOOL_NAME = "final_result"
+
+_PREDICTION_SCHEMA = HazmatPrediction.model_json_schema()
+
+
+async def predict_with_batch_api(
+    model: Model,
+    system_prompt: str,
+    prompts: Mapping[str, str],
+    poll_interval: float = DEFAULT_POLL_INTERVAL,
+) -> list[HazmatPrediction]:
+    """Submit one request per item to the model provider's batch API and wait for the results.
+
+    Args:
+        model: The model to use; only OpenAI and Anthropic models are supported
+        system_prompt: The system prompt shared by all requests
+        prompts: The user prompt for each item, by item ID
+        poll_interval: Seconds to wait between checks of the batch status
+
+    Returns:
+        The predictions for the items whose request succeeded. Failed requests
+        are logged and left out.
+    """
+    if not prompts:
+        return []
+
+    match model:
+        case OpenAIModel():
+            return await _predict_with_openai_batch(
+                model, system_prompt, prompts, poll_interval
+            )
+        case AnthropicModel():
+            return await _predict_with_anthropic_batch(
+                model, system_prompt, prompts, poll_interval
+            )
+        case _:
+            raise ValueError(
+                f"Batch APIs are not supported for {model.system} models,"
+                " only for OpenAI and Anthropic models"
+            )
+
+
+async def _predict_with_openai_batch(
+    model: OpenAIModel,
+    system_prompt: str,
+    prompts: Mapping[str, str],
+    poll_interval: float,
+) -> list[HazmatPrediction]:
+    requests = b"\n".join(
+        json.dumps(
+            {
+                "custom_id": item_id,
+                "method": "POST",
+                "url": _OPENAI_ENDPOINT,
+                "body": {
+                    "model": model.model_name,
+                    "messages": [
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": prompt},
+                    ],
+                    "response_format": {
+                        "type": "json_schema",
+                        "json_schema": {
+                            "name": HazmatPrediction.__name__,
+                            "schema": _PREDICTION_SCHEMA,
+                        },
+                    },
+                },
+            }
+        ).encode()
+        for item_id, prompt in prompts.items()
+    )
+
+    input_file = await model.client.files.create(
+        file=("requests.jsonl", requests),
+        purpose="batch",
+    )
+    batch = await model.client.batches.create(
+        input_file_id=input_file.id,
+        endpoint=_OPENAI_ENDPOINT,
+        completion_window="24h",
+    )
+    logger.info(f"Submitted OpenAI batch {batch.id} with {len(prompts)} requests")
+
+    while batch.status not in _OPENAI_FINAL_STATUSES:
+        await asyncio.sleep(poll_interval)
+        batch = await model.client.batches.retrieve(batch.id)
+
+    logger.info(f"OpenAI batch {batch.id} finished with status '{batch.status}'")
+
+    # Requests that failed altogether are only listed in the error file
+    if batch.error_file_id is not None:
+        errors = await model.client.files.content(batch.error_file_id)
+        for line in errors.content.splitlines():
+            result = json.loads(line)
+            logger.error(
+                f"Batch request for item {result['custom_id']} failed: {result}"
+            )
+
+    # Expired batches still have results for the requests that did complete
+    if batch.output_file_id is None:
+        return []
+
+    output = await model.client.files.content(batch.output_file_id)
+
+    predictions: list[HazmatPrediction] = []
+    for line in output.content.splitlines():
+        result = json.loads(line)
+        item_id = result["custom_id"]
+        response = result.get("response")
+        if result.get("error") or not response or response["status_code"] != 200:
+            logger.error(f"Batch request for item {item_id} failed: {result}")
+            continue
+
+        message = response["body"]["choices"][0]["message"]
+        if (content := message.get("content")) is None:
+            logger.error(
+                f"Batch response for item {item_id} has no prediction: {message}"
+            )
+            continue
+
+        if (prediction := _parse_prediction(item_id, content)) is not None:
+            predictions.append(prediction)
+    return predictions
+
+
+async def _predict_with_anthropic_batch(
+    model: AnthropicModel,
+    system_prompt: str,
+    prompts: Mapping[str, str],
+    poll_interval: float,
+) -> list[HazmatPrediction]:
+    # Structured output is obtained by forcing a call to a single tool whose
+    # input schema is the prediction schema
+    batch = await model.client.messages.batches.create(
+        requests=[
+            {
+                "custom_id": item_id,
+                "params": {
+                    "model": model.model_name,
+                    "max_tokens": _ANTHROPIC_MAX_TOKENS,
+                    "system": [
+                        {
+                            "type": "text",
+                            "text": system_prompt,
+                            "cache_control": {"type": "ephemeral"},
+                        }
+                    ],
+                    "messages": [{"role": "user", "content": prompt}],
+                    "tools": [
+                        {
+                            "name": _PREDICTION_TOOL_NAME,
+                            "description": "The final classification result.",
+                            "input_schema": _PREDICTION_SCHEMA,
+                        }
+                    ],
+                    "tool_choice": {"type": "tool", "name": _PREDICTION_TOOL_NAME},
+                },
+            }
+            for item_id, prompt in prompts.items()
+        ]
+    )
+    logger.info(f"Submitted Anthropic batch {batch.id} with {len(prompts)} requests")
+
+    while batch.processing_status != "ended":
+        await asyncio.sleep(poll_interval)
+        batch = await model.client.messages.batches.retrieve(batch.id)
+
+    logger.info(f"Anthropic batch {batch.id} ended")
+
+    predictions: list[HazmatPrediction] = []
+    async for response in await model.client.messages.batches.results(batch.id):
+        item_id = response.custom_id
+        if response.result.type != "succeeded":
+            logger.error(
+                f"Batch request for item {item_id} {response.result.type}: {response.result}"
+            )
+            continue
+
+        tool_input = next(
+            (
+                block.input
+                for block in response.result.message.content
+                if block.type == "tool_use" and block.name == _PREDICTION_TOOL_NAME
+            ),
+            None,
+        )
+        if tool_input is None:
+            logger.error(f"Batch response for item {item_id} has no prediction")
+            continue
+
+        if (prediction := _parse_prediction(item_id, tool_input)) is not None:
+            predictions.append(prediction)
+    return predictions
+
+
+def _parse_prediction(item_id: str, output: object) -> HazmatPrediction | None:
+    """Validate a model output, as JSON text or parsed, as the prediction for an item.
+
+    Invalid outputs are logged and None is returned, so that they do not discard
+    the rest of the batch.
+    """
+    try:
+        if isinstance(output, str):
+            prediction = HazmatPrediction.model_validate_json(output)
+        else:
+            prediction = HazmatPrediction.model_validate(output)
+    except (ValidationError, TypeError) as e:
+        logger.error(
+            f"Batch response for item {item_id} is not a valid prediction: {e}"
+        )
+        return None
+    return prediction.model_copy(update={"item_id": item_id})
@@ -1,9 +1,16 @@
 """RAG-based example store for hazmat classification using LangChain and ChromaDB."""
 
+import asyncio
 import logging
-from dataclasses import dataclass
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping, Sequence
+from dataclasses import dataclass, field
 from pathlib import Path
+from typing import Any, assert_never, cast
 
+from asyncer import asyncify
+from chromadb import Collection, Where
 from langchain_chroma import Chroma
 from langchain_core.documents import Document
 from langchain_core.embeddings import Embeddings
@@ -17,6 +24,168 @@ from hazmate.input_datasets.input_items import HazmatInputItem
 
 logger = logging.getLogger(__name__)
 
+# Documents are embedded in chunks of this size, with a bounded number of
+# chunks in flight to stay within the embedding provider's rate limits
+_EMBEDDING_CHUNK_SIZE = 100
+_MAX_CONCURRENT_EMBEDDING_REQUESTS = 5
+
+# Number of `(query, count)` retrieval results kept in memory
+_RETRIEVAL_CACHE_SIZE = 2048
+
+# Concurrent `aretrieve` calls made within this many seconds of each other, up
+# to this many calls, are embedded with a single request
+_RETRIEVAL_BATCH_SIZE = 64
+_RETRIEVAL_BATCH_DELAY = 0.01
+
+# Traits are stored in document metadata as an integer of 5-bit codes, first
+# trait in the lowest bits, with other traits taken in order from a separate
+# string. The codes are persisted, so they must never be changed or reused.
+_KNOWN_TRAIT_CODES: dict[KnownHazmatTrait, int] = {
+    KnownHazmatTrait.FLAMMABLE: 1,
+    KnownHazmatTrait.EXPLOSIVE: 2,
+    KnownHazmatTrait.OXIDIZING: 3,
+    KnownHazmatTrait.CORROSIVE: 4,
+    KnownHazmatTrait.COMPRESSED_GAS: 5,
+    KnownHazmatTrait.TOXIC: 6,
+    KnownHazmatTrait.CARCINOGENIC: 7,
+    KnownHazmatTrait.IRRITANT: 8,
+    KnownHazmatTrait.SENSITIZING: 9,
+    KnownHazmatTrait.MUTAGENIC: 10,
+    KnownHazmatTrait.REPRODUCTIVE_TOXICITY: 11,
+    KnownHazmatTrait.AQUATIC_TOXICITY: 12,
+    KnownHazmatTrait.OZONE_DEPLETION: 13,
+    KnownHazmatTrait.RADIOACTIVE: 14,
+    KnownHazmatTrait.INFECTIOUS: 15,
+}
+_KNOWN_TRAITS_BY_CODE = {code: trait for trait, code in _KNOWN_TRAIT_CODES.items()}
+_KNOWN_TRAITS_BY_STR = {trait.trait_str: trait for trait in KnownHazmatTrait}
+_TRAIT_CODE_BITS = 5
+_TRAIT_CODE_MASK = (1 << _TRAIT_CODE_BITS) - 1
+_OTHER_TRAIT_CODE = _TRAIT_CODE_MASK
+# Chroma stores integers as signed 64-bit values; examples with more traits
+# fall back to a single comma-separated string
+_MAX_ENCODED_TRAITS = 63 // _TRAIT_CODE_BITS
+
+type _RetrievalKey = tuple[str, int]
+type _PendingRetrieval = tuple[
+    HazmatInputItem, int, asyncio.Future[list[HazmatLabeledItem]]
+]
+
+
+@dataclass(slots=True)
+class _RetrievalCache:
+    """Thread-safe LRU cache of retrieval results, keyed by query and count.
+
+    Results are only stored if the cache was not invalidated while they were
+    being computed, so a search racing with an update never caches stale results.
+    """
+
+    max_size: int
+    entries: OrderedDict[_RetrievalKey, list[HazmatLabeledItem]] = field(
+        default_factory=OrderedDict
+    )
+    version: int = 0
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def get(self, key: _RetrievalKey) -> list[HazmatLabeledItem] | None:
+        with self.lock:
+            if (examples := self.entries.get(key)) is None:
+                return None
+            self.entries.move_to_end(key)
+            return list(examples)
+
+    def put(
+        self, key: _RetrievalKey, examples: list[HazmatLabeledItem], version: int
+    ) -> None:
+        with self.lock:
+            if version != self.version:
+                return
+            self.entries[key] = list(examples)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def invalidate(self) -> None:
+        with self.lock:
+            self.version += 1
+            self.entries.clear()
+
+
+@dataclass(slots=True)
+class _RetrievalBatcher:
+    """Collects concurrent retrievals and runs them as a single `retrieve_many` call.
+
+    The background dispatcher is bound to the event loop of the first call, and
+    replaced if the store is later used from another event loop.
+    """
+
+    max_batch_size: int
+    max_delay: float
+    queue: asyncio.Queue[_PendingRetrieval] = field(default_factory=asyncio.Queue)
+    dispatcher: asyncio.Task[None] | None = None
+    batch_tasks: set[asyncio.Task[None]] = field(default_factory=set)
+
+    async def retrieve(
+        self, store: "ExampleStore", input_item: HazmatInputItem, count: int
+    ) -> list[HazmatLabeledItem]:
+        loop = asyncio.get_running_loop()
+        if (
+            self.dispatcher is None
+            or self.dispatcher.done()
+            or self.dispatcher.get_loop() is not loop
+        ):
+            self.queue = asyncio.Queue()
+            self.dispatcher = loop.create_task(self._dispatch(store))
+
+        future: asyncio.Future[list[HazmatLabeledItem]] = loop.create_future()
+        self.queue.put_nowait((input_item, count, future))
+        return await future
+
+    async def _dispatch(self, store: "ExampleStore") -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            # Wait for the first call, then collect more until the batch is full
+            # or the delay since the first call has elapsed
+            pending = [await self.queue.get()]
+            deadline = loop.time() + self.max_delay
+            while len(pending) < self.max_batch_size:
+                try:
+                    pending.append(
+                        await asyncio.wait_for(
+                            self.queue.get(), timeout=deadline - loop.time()
+                        )
+                    )
+                except TimeoutError:
+                    break
+
+            # `retrieve_many` takes a single count, so calls are grouped by count
+            pending_by_count: dict[int, list[_PendingRetrieval]] = {}
+            for retrieval in pending:
+                pending_by_count.setdefault(retrieval[1], []).append(retrieval)
+
+            for count, retrievals in pending_by_count.items():
+                task = loop.create_task(self._retrieve(store, count, retrievals))
+                self.batch_tasks.add(task)
+                task.add_done_callback(self.batch_tasks.discard)
+
+    async def _retrieve(
+        self, store: "ExampleStore", count: int, pending: list[_PendingRetrieval]
+    ) -> None:
+        try:
+            results = await asyncify(store.retrieve_many)(
+                [input_item for input_item, _, _ in pending], count=count
+            )
+        except Exception as e:
+            for _, _, future in pending:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, _, future), examples in zip(pending, results, strict=True):
+            # The caller may have been cancelled while waiting
+            if not future.done():
+                future.set_result(examples)
+
 
 @dataclass(frozen=True, slots=True)
 class ExampleStore:
@@ -28,6 +197,16 @@ class ExampleStore:
 
     embedding_function: Embeddings
     vector_store: Chroma
+    retrieval_cache: _RetrievalCache = field(
+        default_factory=lambda: _RetrievalCache(max_size=_RETRIEVAL_CACHE_SIZE),
+        repr=False,
+    )
+    retrieval_batcher: _RetrievalBatcher = field(
+        default_factory=lambda: _RetrievalBatcher(
+            max_batch_size=_RETRIEVAL_BATCH_SIZE, max_delay=_RETRIEVAL_BATCH_DELAY
+        ),
+        repr=False,
+    )
 
     @classmethod
     def from_embedding_model_name_and_persist_directory(
@@ -55,6 +234,9 @@ class ExampleStore:
         vector_store = Chroma(
             embedding_function=embedding_function,
             persist_directory=str(persist_directory) if persist_directory else None,
+            # Rank by cosine distance, which does not depend on the embedding
+            # model normalizing its vectors. This only applies to new stores.
+            collection_metadata={"hnsw:space": "cosine"},
         )
         return cls(embedding_function=embedding_function, vector_store=vector_store)
 
@@ -68,6 +250,23 @@ class ExampleStore:
         This creates a comprehensive text representation that includes both
         the item content and the human annotation for better RAG performance.
         """
+        # Go over the traits once, collecting their text for the content and
+        # their stored form for the metadata
+        trait_strs: list[str] = []
+        trait_codes = 0
+        other_traits: list[str] = []
+        for index, trait in enumerate(labeled_item.traits):
+            trait_strs.append(self._trait_to_string(trait))
+            match trait:
+                case KnownHazmatTrait():
+                    code = _KNOWN_TRAIT_CODES[trait]
+                case OtherHazmatTrait():
+                    code = _OTHER_TRAIT_CODE
+                    other_traits.append(trait.trait)
+                case never:
+                    assert_never(never)
+            trait_codes |= code << (index * _TRAIT_CODE_BITS)
+
         # Create the main content for embedding
         content_parts = [
             f"Product: {labeled_item.name}",
@@ -89,11 +288,8 @@ class ExampleStore:
             f"Classification: {'HAZMAT' if labeled_item.is_hazmat else 'NOT HAZMAT'}"
         )
 
-        if labeled_item.traits:
-            traits_text = ", ".join(
-                self._trait_to_string(trait) for trait in labeled_item.traits
-            )
-            content_parts.append(f"Hazmat Traits: {traits_text}")
+        if trait_strs:
+            content_parts.append(f"Hazmat Traits: {', '.join(trait_strs)}")
 
         content_parts.append(f"Reason: {labeled_item.reason}")
 
@@ -105,11 +301,13 @@ class ExampleStore:
             "domain_id": labeled_item.domain_id,
             "family_name": labeled_item.family_name,
             "is_hazmat": labeled_item.is_hazmat,
-            "traits": ", ".join(
-                self._trait_to_string(trait) for trait in labeled_item.traits
-            ),
             "reason": labeled_item.reason,
         }
+        if len(trait_strs) <= _MAX_ENCODED_TRAITS:
+            metadata["trait_codes"] = trait_codes
+            metadata["other_traits"] = ", ".join(other_traits)
+        else:
+            metadata["traits"] = ", ".join(trait_strs)
 
         return Document(page_content=page_content, metadata=metadata)
 
@@ -140,15 +338,11 @@ class ExampleStore:
         # Convert to Document
         document = self._labeled_item_to_document(labeled_item)
 
-        # Check if item already exists and remove it first
-        existing_docs = self.vector_store.get(where={"item_id": labeled_item.item_id})
-
-        if existing_docs["ids"]:
-            logger.info(f"Updating existing example for item {labeled_item.item_id}")
-            self.vector_store.delete(ids=existing_docs["ids"])
-
-        # Add the new document
-        self.vector_store.add_documents([document])
+        # Documents are stored under their item ID, so this replaces any existing
+        # example for the same item
+        self._delete_examples_under_other_ids([labeled_item.item_id])
+        self.vector_store.add_documents([document], ids=[labeled_item.item_id])
+        self.retrieval_cache.invalidate()
 
         logger.info(
             f"Successfully added/updated example for item {labeled_item.item_id}"
@@ -157,27 +351,109 @@ class ExampleStore:
     def add_batch(self, labeled_items: list[HazmatLabeledItem]) -> None:
         """Add multiple examples in batch for better performance.
 
+        All documents are embedded with a single call to the embedding model,
+        then upserted into the vector store with a single call.
+
         Args:
             labeled_items: List of human-annotated examples to add
         """
+        if not labeled_items:
+            return
+
         logger.info(f"Adding batch of {len(labeled_items)} examples")
 
-        # Convert all items to documents
-        documents = [self._labeled_item_to_document(item) for item in labeled_items]
+        documents_by_id = self._labeled_items_to_documents_by_id(labeled_items)
+        embeddings = self.embedding_function.embed_documents(
+            [document.page_content for document in documents_by_id.values()]
+        )
+        self._upsert_documents(documents_by_id, embeddings)
+
+        logger.info(
+            f"Successfully added/updated batch of {len(labeled_items)} examples"
+        )
+
+    async def aadd_batch(self, labeled_items: list[HazmatLabeledItem]) -> None:
+        """Add multiple examples in batch, asynchronously.
+
+        Documents are embedded in chunks sent to the embedding model
+        concurrently, then upserted into the vector store with a single call.
+
+        Args:
+            labeled_items: List of human-annotated examples to add
+        """
+        if not labeled_items:
+            return
 
-        # Remove existing documents for items being updated
-        for item in labeled_items:
-            existing_docs = self.vector_store.get(where={"item_id": item.item_id})
-            if existing_docs["ids"]:
-                self.vector_store.delete(ids=existing_docs["ids"])
+        logger.info(f"Adding batch of {len(labeled_items)} examples")
 
-        # Add all documents at once
-        self.vector_store.add_documents(documents)
+        documents_by_id = self._labeled_items_to_documents_by_id(labeled_items)
+        embeddings = await self._aembed_documents(
+            [document.page_content for document in documents_by_id.values()]
+        )
+        await asyncify(self._upsert_documents)(documents_by_id, embeddings)
 
         logger.info(
             f"Successfully added/updated batch of {len(labeled_items)} examples"
         )
 
+    def _labeled_items_to_documents_by_id(
+        self, labeled_items: list[HazmatLabeledItem]
+    ) -> dict[str, Document]:
+        # Keep only the last example for each item, since Chroma rejects
+        # duplicate IDs within a single call
+        items_by_id = {item.item_id: item for item in labeled_items}
+        return {
+            item_id: self._labeled_item_to_document(item)
+            for item_id, item in items_by_id.items()
+        }
+
+    def _upsert_documents(
+        self,
+        documents_by_id: Mapping[str, Document],
+        embeddings: Sequence[Sequence[float]],
+    ) -> None:
+        # Upsert all documents at once, with their precomputed embeddings. They
+        # are stored under their item ID, which replaces existing examples for
+        # the same items.
+        self._delete_examples_under_other_ids(list(documents_by_id))
+        upsert_embeddings: list[Sequence[float] | Sequence[int]] = list(embeddings)
+        self._chroma_collection().upsert(
+            ids=list(documents_by_id),
+            embeddings=upsert_embeddings,
+            metadatas=[document.metadata for document in documents_by_id.values()],
+            documents=[document.page_content for document in documents_by_id.values()],
+        )
+        self.retrieval_cache.invalidate()
+
+    def _delete_examples_under_other_ids(self, item_ids: Sequence[str]) -> None:
+        """Delete examples of the given items that are not stored under their item ID.
+
+        Stores created before examples were keyed by item ID hold them under
+        random IDs, which upserting by item ID would leave behind as duplicates.
+        """
+        # chromadb types `$in` filters too narrowly for a dict literal to match
+        where = cast(Where, {"item_id": {"$in": list(item_ids)}})
+        stored_ids = self.vector_store.get(where=where, include=[])["ids"]
+        if stale_ids := sorted(set(stored_ids) - set(item_ids)):
+            logger.info(f"Deleting {len(stale_ids)} examples stored under old IDs")
+            self.vector_store.delete(ids=stale_ids)
+
+    async def _aembed_documents(self, texts: Sequence[str]) -> list[list[float]]:
+        """Embed texts in chunks, with a bounded number of concurrent requests."""
+        semaphore = asyncio.Semaphore(_MAX_CONCURRENT_EMBEDDING_REQUESTS)
+
+        async def embed_chunk(chunk: Sequence[str]) -> list[list[float]]:
+            async with semaphore:
+                return await self.embedding_function.aembed_documents(list(chunk))
+
+        chunk_embeddings = await asyncio.gather(
+            *(
+                embed_chunk(texts[start : start + _EMBEDDING_CHUNK_SIZE])
+                for start in range(0, len(texts), _EMBEDDING_CHUNK_SIZE)
+            )
+        )
+        return [embedding for chunk in chunk_embeddings for embedding in chunk]
+
     def retrieve(
         self,
         input_item: HazmatInputItem,
@@ -199,55 +475,167 @@ class ExampleStore:
         # Create search query
         query = self._input_item_to_query(input_item)
 
+        # Items with the same content share results, as long as the store has
+        # not changed since they were retrieved
+        if (results := self.retrieval_cache.get((query, count))) is not None:
+            logger.debug(f"Reusing {len(results)} cached examples")
+            return results
+        version = self.retrieval_cache.version
+
         # Perform similarity search
-        docs = self.vector_store.similarity_search(query, k=count)
-
-        # Convert back to HazmatLabeledItem objects
-        results = []
-        for doc in docs:
-            metadata = doc.metadata
-
-            # Reconstruct traits from metadata (stored as comma-separated string)
-            traits: list[HazmatTrait] = []
-            traits_str = metadata.get("traits", "")
-            if traits_str:
-                for trait_str in traits_str.split(", "):
-                    trait_str = trait_str.strip()
-                    if trait_str:
-                        # Try to match known traits first
-                        try:
-                            traits.append(KnownHazmatTrait(trait_str))
-                        except ValueError:
-                            # If not a known trait, treat as other trait
-                            traits.append(OtherHazmatTrait(trait=trait_str))
-
-            labeled_item = HazmatLabeledItem(
-                item_id=metadata["item_id"],
-                name=metadata["name"],
-                domain_id=metadata["domain_id"],
-                family_name=metadata["family_name"],
-                description="",  # Not stored in metadata for brevity
-                short_description="",  # Not stored in metadata for brevity
-                keywords="",  # Not stored in metadata for brevity
-                is_hazmat=metadata["is_hazmat"],
-                traits=traits,
-                reason=metadata["reason"],
-            )
-            results.append(labeled_item)
+        [results] = self._search_by_vectors(
+            [self.embedding_function.embed_query(query)], count=count
+        )
+        self.retrieval_cache.put((query, count), results, version)
 
         logger.debug(f"Retrieved {len(results)} similar examples")
         return results
 
+    async def aretrieve(
+        self,
+        input_item: HazmatInputItem,
+        count: int = 5,
+    ) -> list[HazmatLabeledItem]:
+        """Retrieve the most similar examples for the given input item, asynchronously.
+
+        Concurrent calls are collected for a few milliseconds and embedded with a
+        single call to the embedding model, as with `retrieve_many`.
+
+        Args:
+            input_item: The item to classify
+            count: Number of examples to retrieve
+
+        Returns:
+            List of similar `HazmatLabeledItem`s, ordered by similarity
+        """
+        return await self.retrieval_batcher.retrieve(self, input_item, count)
+
+    def retrieve_many(
+        self,
+        input_items: Sequence[HazmatInputItem],
+        count: int = 5,
+    ) -> list[list[HazmatLabeledItem]]:
+        """Retrieve the most similar examples for each of the given input items.
+
+        All queries are embedded with a single call to the embedding model, instead
+        of one call per item as with `retrieve`. Queries with cached results, as
+        well as repeated queries, are not embedded at all.
+
+        Args:
+            input_items: The items to classify
+            count: Number of examples to retrieve for each item
+
+        Returns:
+            One list of similar `HazmatLabeledItem`s per input item, in input order
+        """
+        logger.debug(
+            f"Retrieving {count} similar examples for {len(input_items)} items"
+        )
+
+        queries = [self._input_item_to_query(item) for item in input_items]
+        results = {query: self.retrieval_cache.get((query, count)) for query in queries}
+        missing_queries = [
+            query for query, examples in results.items() if examples is None
+        ]
+
+        if missing_queries:
+            version = self.retrieval_cache.version
+            embeddings = self.embedding_function.embed_documents(missing_queries)
+            for query, examples in zip(
+                missing_queries,
+                self._search_by_vectors(embeddings, count=count),
+                strict=True,
+            ):
+                results[query] = examples
+                self.retrieval_cache.put((query, count), examples, version)
+
+        return [list(results[query] or ()) for query in queries]
+
+    def _search_by_vectors(
+        self, embeddings: Sequence[Sequence[float]], count: int
+    ) -> list[list[HazmatLabeledItem]]:
+        """Find the examples closest to each embedding with a single query.
+
+        Examples are rebuilt from metadata alone, so only metadata is fetched,
+        leaving out the document contents and embeddings.
+        """
+        if not embeddings:
+            return []
+
+        results = self._chroma_collection().query(
+            query_embeddings=list(embeddings),
+            n_results=count,
+            include=["metadatas"],
+        )
+        return [
+            [self._metadata_to_labeled_item(metadata) for metadata in metadatas]
+            for metadatas in results["metadatas"] or ()
+        ]
+
+    def _chroma_collection(self) -> Collection:
+        """Get the Chroma collection behind the vector store.
+
+        `Chroma` has no public API to upsert precomputed embeddings, run several
+        queries in one call or count documents, so these go through its private
+        `_collection` attribute. Written for langchain-chroma 0.2.4, the locked
+        version, and also works with 1.1; recheck it when upgrading.
+        """
+        return self.vector_store._collection
+
+    def _metadata_to_labeled_item(
+        self, metadata: Mapping[str, Any]
+    ) -> HazmatLabeledItem:
+        """Convert the metadata of a stored document back to a HazmatLabeledItem."""
+
+        # Reconstruct traits from metadata, with known traits stored as codes
+        # and other traits as a comma-separated string
+        traits: list[HazmatTrait] = []
+        if "trait_codes" in metadata:
+            trait_codes = metadata["trait_codes"]
+            other_traits = iter(
+                other_traits_str.split(", ")
+                if (other_traits_str := metadata.get("other_traits"))
+                else ()
+            )
+            while trait_codes:
+                code = trait_codes & _TRAIT_CODE_MASK
+                trait_codes >>= _TRAIT_CODE_BITS
+                if code == _OTHER_TRAIT_CODE:
+                    traits.append(OtherHazmatTrait(trait=next(other_traits)))
+                else:
+                    traits.append(_KNOWN_TRAITS_BY_CODE[code])
+        elif traits_str := metadata.get("traits"):
+            # Examples added before traits were stored as codes, or with too
+            # many traits for them, have all their traits in a single string
+            for trait_str in traits_str.split(", "):
+                trait_str = trait_str.strip()
+                if trait_str:
+                    # Match known traits first, and treat any other trait as such
+                    traits.append(
+                        _KNOWN_TRAITS_BY_STR.get(trait_str)
+                        or OtherHazmatTrait(trait=trait_str)
+                    )
+
+        return HazmatLabeledItem(
+            item_id=metadata["item_id"],
+            name=metadata["name"],
+            domain_id=metadata["domain_id"],
+            family_name=metadata["family_name"],
+            description="",  # Not stored in metadata for brevity
+            short_description="",  # Not stored in metadata for brevity
+            keywords="",  # Not stored in metadata for brevity
+            is_hazmat=metadata["is_hazmat"],
+            traits=traits,
+            reason=metadata["reason"],
+        )
+
     def get_stats(self) -> dict[str, int]:
         """Get statistics about the example store."""
-        # Get all documents
-        all_docs = self.vector_store.get()
-        total_count = len(all_docs["ids"])
-
-        # Count hazmat vs non-hazmat
-        hazmat_count = sum(
-            metadata and metadata.get("is_hazmat", False)
-            for metadata in all_docs["metadatas"]
+        # Count in the database, fetching only the IDs of hazmat examples rather
+        # than the metadata of every document
+        total_count = self._chroma_collection().count()
+        hazmat_count = len(
+            self.vector_store.get(where={"is_hazmat": True}, include=[])["ids"]
         )
         non_hazmat_count = total_count - hazmat_count
 
@@ -262,8 +650,9 @@ class ExampleStore:
         logger.warning("Clearing all examples from the store")
 
         # Get all document IDs and delete them
-        all_docs = self.vector_store.get()
+        all_docs = self.vector_store.get(include=[])
         if all_docs["ids"]:
             self.vector_store.delete(ids=all_docs["ids"])
+        self.retrieval_cache.invalidate()
 
         logger.info("All examples cleared")
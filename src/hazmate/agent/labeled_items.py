@@ -70,7 +70,9 @@ class HazmatLabeledItem(BaseModel):
                 prediction_item_id=prediction.item_id,
             )
 
-        return cls(
+        # Both objects were validated when they were created, so the combined
+        # item is built without validating the same data again
+        return cls.model_construct(
             # Input data
             item_id=input_item.item_id,
             name=input_item.name,
@@ -81,14 +83,14 @@ class HazmatLabeledItem(BaseModel):
             keywords=input_item.keywords,
             # Prediction results
             is_hazmat=prediction.is_hazmat,
-            traits=prediction.traits,
+            traits=list(prediction.traits),
             reason=prediction.reason,
         )
 
     @property
     def input_item(self) -> HazmatInputItem:
         """The input item."""
-        return HazmatInputItem(
+        return HazmatInputItem.model_construct(
             item_id=self.item_id,
             name=self.name,
             domain_id=self.domain_id,
@@ -100,9 +102,9 @@ class HazmatLabeledItem(BaseModel):
     @property
     def prediction(self) -> HazmatPrediction:
         """The prediction."""
-        return HazmatPrediction(
+        return HazmatPrediction.model_construct(
             item_id=self.item_id,
             is_hazmat=self.is_hazmat,
-            traits=self.traits,
+            traits=list(self.traits),
             reason=self.reason,
         )
@@ -0,0 +1,135 @@
+"""Combine concurrent single-item predictions into packed batch requests."""
+
+import asyncio
+from dataclasses import dataclass, field
+from typing import Self
+
+from loguru import logger
+
+from hazmate.agent.agent import HazmatAgent, MismatchedPredictionsError
+from hazmate.agent.predictions import HazmatPrediction
+from hazmate.input_datasets.input_items import HazmatInputItem
+
+type _PendingPrediction = tuple[HazmatInputItem, asyncio.Future[HazmatPrediction]]
+
+
+@dataclass
+class MicroBatchingHazmatAgent:
+    """Wrapper around `HazmatAgent` that batches concurrent `predict_item` calls.
+
+    Calls made within `max_delay` seconds of each other are collected, up to
+    `max_batch_size` items, and sent to the model as a single packed request.
+    Each caller still gets back only the prediction for its own item.
+
+    Use it as an async context manager, or call `aclose` when done, to stop the
+    background dispatcher.
+    """
+
+    agent: HazmatAgent
+    max_batch_size: int = 8
+    max_delay: float = 0.25
+
+    _queue: asyncio.Queue[_PendingPrediction] = field(
+        default_factory=asyncio.Queue, init=False, repr=False
+    )
+    _dispatcher: asyncio.Task[None] | None = field(default=None, init=False, repr=False)
+    _batch_tasks: set[asyncio.Task[None]] = field(
+        default_factory=set, init=False, repr=False
+    )
+
+    async def __aenter__(self) -> Self:
+        return self
+
+    async def __aexit__(self, *exc_info: object) -> None:
+        await self.aclose()
+
+    async def predict_item(self, item: HazmatInputItem) -> HazmatPrediction:
+        """Predict hazmat classification for a single item, batched with concurrent calls."""
+        if self._dispatcher is None:
+            self._dispatcher = asyncio.create_task(self._dispatch())
+
+        future: asyncio.Future[HazmatPrediction] = (
+            asyncio.get_running_loop().create_future()
+        )
+        self._queue.put_nowait((item, future))
+        return await future
+
+    async def aclose(self) -> None:
+        """Stop collecting new calls and wait for all calls made so far to finish."""
+        if self._dispatcher is not None:
+            # The dispatcher sends the calls it has not sent yet when cancelled
+            self._dispatcher.cancel()
+            await asyncio.wait([self._dispatcher])
+            self._dispatcher = None
+        if self._batch_tasks:
+            await asyncio.wait(self._batch_tasks)
+
+    async def _dispatch(self) -> None:
+        loop = asyncio.get_running_loop()
+        pending: list[_PendingPrediction] = []
+        try:
+            while True:
+                # Wait for the first call, then collect more until the batch is
+                # full or the delay since the first call has elapsed
+                pending = [await self._queue.get()]
+                deadline = loop.time() + self.max_delay
+                while len(pending) < self.max_batch_size:
+                    try:
+                        pending.append(
+                            await asyncio.wait_for(
+                                self._queue.get(), timeout=deadline - loop.time()
+                            )
+                        )
+                    except TimeoutError:
+                        break
+
+                # Keep collecting the next batch while this one is in flight
+                self._start_batch(pending)
+                pending = []
+        except asyncio.CancelledError:
+            # Send the calls collected so far, so that no caller waits forever
+            while not self._queue.empty():
+                pending.append(self._queue.get_nowait())
+            for start in range(0, len(pending), self.max_batch_size):
+                self._start_batch(pending[start : start + self.max_batch_size])
+            raise
+
+    def _start_batch(self, pending: list[_PendingPrediction]) -> None:
+        task = asyncio.create_task(self._predict(pending))
+        self._batch_tasks.add(task)
+        task.add_done_callback(self._batch_tasks.discard)
+
+    async def _predict(self, pending: list[_PendingPrediction]) -> None:
+        items = [item for item, _ in pending]
+        logger.debug(f"Dispatching micro-batch of {len(items)} items")
+
+        try:
+            if len(items) == 1:
+                predictions = [
+                    await self.agent.predict_item(items[0], on_different_id="fix")
+                ]
+            else:
+                predictions = await self.agent.predict_batch(
+                    items,
+                    allow_mismatched_predictions=True,
+                )
+        except Exception as e:
+            for _, future in pending:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        predictions_map = {prediction.item_id: prediction for prediction in predictions}
+        for item, future in pending:
+            if future.done():
+                # The caller was cancelled while waiting
+                continue
+            if (prediction := predictions_map.get(item.item_id)) is not None:
+                future.set_result(prediction)
+            else:
+                future.set_exception(
+                    MismatchedPredictionsError(
+                        input_ids={item.item_id},
+                        prediction_ids=set(),
+                    )
+                )
@@ -0,0 +1,91 @@
+"""Persistent cache of hazmat predictions, keyed by what the model was asked."""
+
+import hashlib
+import json
+import sqlite3
+import threading
+from collections.abc import Mapping, Sequence
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Self
+
+from hazmate.agent.predictions import HazmatPrediction
+
+
+@dataclass(frozen=True, slots=True)
+class PredictionCache:
+    """SQLite-backed cache of predictions for previously classified items.
+
+    Keys are built with `get_key` from everything that determines the model's
+    answer, so changing the model, the system prompt or the item content
+    results in a cache miss instead of a stale prediction.
+    """
+
+    connection: sqlite3.Connection
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    @classmethod
+    def from_path(cls, path: str | Path) -> Self:
+        """Open (or create) a prediction cache stored in a SQLite file."""
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        # Lookups run in worker threads, so the connection is shared between
+        # threads and guarded by `lock`
+        connection = sqlite3.connect(path, check_same_thread=False, autocommit=True)
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS predictions"
+            " (key TEXT PRIMARY KEY, prediction TEXT NOT NULL)"
+        )
+        return cls(connection=connection)
+
+    @staticmethod
+    def get_key(model_name: str, system_prompt: str, item_content: str) -> str:
+        """Get the cache key for an item classified by a given model and prompt."""
+        return hashlib.sha256(
+            json.dumps(
+                {
+                    "model": model_name,
+                    "system_prompt": system_prompt,
+                    "item": item_content,
+                },
+                sort_keys=True,
+            ).encode()
+        ).hexdigest()
+
+    def get_many(self, keys: Sequence[str]) -> dict[str, HazmatPrediction]:
+        """Get the cached predictions for the given keys, skipping missing ones."""
+        if not keys:
+            return {}
+
+        placeholders = ", ".join("?" * len(keys))
+        with self.lock:
+            rows = self.connection.execute(
+                f"SELECT key, prediction FROM predictions WHERE key IN ({placeholders})",
+                keys,
+            ).fetchall()
+
+        return {
+            key: HazmatPrediction.model_validate_json(prediction)
+            for key, prediction in rows
+        }
+
+    def set_many(self, predictions: Mapping[str, HazmatPrediction]) -> None:
+        """Store predictions under the given keys, replacing existing entries."""
+        with self.lock:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO predictions (key, prediction) VALUES (?, ?)",
+                [
+                    (key, prediction.model_dump_json())
+                    for key, prediction in predictions.items()
+                ],
+            )
+
+    def close(self) -> None:
+        """Close the underlying database connection."""
+        with self.lock:
+            self.connection.close()
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
@@ -5,9 +5,9 @@ This script is used to build the hazmate dataset.
 
 import asyncio
 import enum
-import json
 from collections import Counter
 from collections.abc import AsyncIterator
+from dataclasses import dataclass, field
 from pathlib import Path
 from pprint import pformat
 from typing import Annotated, assert_never
@@ -45,12 +45,24 @@ from hazmate.input_datasets.queries.category_attributes import (
     get_category_attributes,
 )
 from hazmate.input_datasets.queries.product import Product, get_product
-from hazmate.input_datasets.queries.search import search_products_paginated
-from hazmate.utils.async_itertools import ainterleave, ainterleave_queued, aislice
+from hazmate.input_datasets.queries.search import (
+    SearchResult,
+    search_products_paginated,
+)
+from hazmate.utils.async_itertools import (
+    ainterleave,
+    ainterleave_queued,
+    aislice,
+    aprefetch,
+)
 from hazmate.utils.oauth import OAuth2Session
 
 QUERY_SIZE_LIMIT = 500
 MAX_CONSECUTIVE_FAILURES = 10  # Avoid infinite loops if many products fail
+MAX_CONCURRENT_CATEGORY_REQUESTS = 16  # Stay within the API rate limits
+MAX_CONCURRENT_PRODUCT_REQUESTS = 64  # Matches the session's connections
+PROGRESS_DESCRIPTION_INTERVAL = 256  # Items between updates of the item count
+WRITE_BUFFER_SIZE = 1024  # Items collected ahead of the writer
 OUTPUT_DIR = Path("data")
 
 app = typer.Typer()
@@ -100,66 +112,138 @@ async def main(
     auth_config = AuthConfig.from_dotenv(".env")
     collector_config = CollectorConfig.from_yaml(config_path)
 
-    async with start_oauth_session(auth_config) as session:
-        api_categories_data = (
-            await _collect_categories_with_subcategories_and_attributes(session)
+    # Save dataset to file
+    output_path = OUTPUT_DIR / output_name
+    if output_path.suffix.lower() != ".jsonl":
+        raise ValueError(
+            f"Invalid output file extension: {output_path.suffix} - only .jsonl is supported"
         )
 
-        _validate_all_categories_in_config_exist(collector_config, api_categories_data)
-        _validate_all_categories_are_in_config(collector_config, api_categories_data)
+    # Statistics are updated as items are written, without keeping the items
+    stats = _DatasetStatistics()
 
-        # Collect items for statistics
-        collected_items: list[HazmatInputItem] = []
+    # The session is opened before the progress display starts, since the first
+    # run asks for authorization on the terminal. A single progress display is
+    # then shared by all steps.
+    async with start_oauth_session(auth_config) as session:
+        with Progress(
+            SpinnerColumn(),
+            TextColumn("[progress.description]{task.description}"),
+            BarColumn(),
+            TimeElapsedColumn(),
+            TimeRemainingColumn(),
+        ) as progress:
+            api_categories_data = (
+                await _collect_categories_with_subcategories_and_attributes(
+                    session, progress
+                )
+            )
 
-        # Save dataset to file
-        output_path = OUTPUT_DIR / output_name
-        if output_path.suffix.lower() != ".jsonl":
-            raise ValueError(
-                f"Invalid output file extension: {output_path.suffix} - only .jsonl is supported"
+            _validate_all_categories_in_config_exist(
+                collector_config, api_categories_data
+            )
+            _validate_all_categories_are_in_config(
+                collector_config, api_categories_data
             )
 
-        with output_path.open("w") as f:
-            with Progress(
-                SpinnerColumn(),
-                TextColumn("[progress.description]{task.description}"),
-                BarColumn(),
-                TimeElapsedColumn(),
-                TimeRemainingColumn(),
-            ) as progress:
-                main_progress_task = progress.add_task(
-                    "[green]Collecting items... (0 / {:,})[/green]".format(target_size),
-                    total=None,
-                )
+            main_progress_task = progress.add_task(
+                "[green]Collecting items... (0 / {:,})[/green]".format(target_size),
+                total=target_size,
+            )
 
-                async for item in _generate_input_dataset_items(
+            # Items are collected in a background task into a bounded buffer,
+            # so the queries keep making progress while items are written
+            items = aprefetch(
+                _generate_input_dataset_items(
                     session,
                     collector_config,
                     target_size=target_size,
                     progress_tracker=progress,
                     main_progress_task=main_progress_task,
                     goal=goal,
-                ):
-                    f.write(json.dumps(item.model_dump()) + "\n")
-                    collected_items.append(item)
+                ),
+                size=WRITE_BUFFER_SIZE,
+            )
+            with output_path.open("w") as f:
+                async for item in items:
+                    # Serialize straight to JSON, without building an intermediate dict
+                    f.write(item.model_dump_json() + "\n")
+                    stats.add(item)
+
+    # Calculate and display statistics
+    _display_statistics(stats, output_name)
+
+
+@dataclass
+class _DatasetStatistics:
+    """Statistics about a dataset, updated one item at a time as it is collected."""
+
+    total_items: int = 0
+    domain_counts: Counter[str] = field(default_factory=Counter)
+    family_counts: Counter[str] = field(default_factory=Counter)
+    items_with_description: int = 0
+    items_with_only_description: int = 0
+    items_with_only_short_description: int = 0
+    items_with_both_descriptions: int = 0
+    items_with_keywords: int = 0
+    items_with_permalink: int = 0
+    items_with_attributes: int = 0
+    total_attributes: int = 0
+    items_with_main_features: int = 0
+    total_main_features: int = 0
+    items_with_any_text: int = 0
+    total_text_length: int = 0
+
+    def add(self, item: HazmatInputItem) -> None:
+        """Account for a collected item."""
+        self.total_items += 1
+        self.domain_counts[item.domain_id] += 1
+        self.family_counts[item.family_name] += 1
+
+        has_description = bool(item.description and item.description.strip())
+        has_short_description = bool(
+            item.short_description and item.short_description.strip()
+        )
+        has_keywords = bool(item.keywords and item.keywords.strip())
 
-        # Calculate and display statistics
-        _calculate_and_display_statistics(collected_items, output_name)
+        self.items_with_description += has_description or has_short_description
+        self.items_with_only_description += (
+            has_description and not has_short_description
+        )
+        self.items_with_only_short_description += (
+            has_short_description and not has_description
+        )
+        self.items_with_both_descriptions += has_description and has_short_description
+        self.items_with_keywords += has_keywords
+        self.items_with_permalink += bool(item.permalink)
 
+        self.items_with_attributes += bool(item.attributes)
+        self.total_attributes += len(item.attributes)
+        self.items_with_main_features += bool(item.main_features)
+        self.total_main_features += len(item.main_features)
 
-def _calculate_and_display_statistics(
-    items: list[HazmatInputItem], output_filename: str
-) -> None:
-    """Calculate and display interesting statistics about the collected dataset."""
+        self.items_with_any_text += (
+            has_description or has_short_description or has_keywords
+        )
+        total_text = item.description or ""
+        if item.short_description:
+            total_text += " " + item.short_description
+        if item.keywords:
+            total_text += " " + item.keywords
+        self.total_text_length += len(total_text.strip())
+
+
+def _display_statistics(stats: _DatasetStatistics, output_filename: str) -> None:
+    """Display interesting statistics about the collected dataset."""
     console = Console()
+    total_items = stats.total_items
 
     console.print(
         f"\n[bold green]📊 Dataset Statistics for {output_filename}[/bold green]"
     )
-    console.print(f"Total items collected: [bold]{len(items):,}[/bold]\n")
+    console.print(f"Total items collected: [bold]{total_items:,}[/bold]\n")
 
     # 1. Count of each domain_id
-    domain_counts = Counter(item.domain_id for item in items)
-
     table = Table(
         title="Domain Distribution", show_header=True, header_style="bold magenta"
     )
@@ -167,109 +251,71 @@ def _calculate_and_display_statistics(
     table.add_column("Count", justify="right", style="green")
     table.add_column("Percentage", justify="right", style="yellow")
 
-    for domain_id, count in domain_counts.most_common():
-        percentage = (count / len(items)) * 100
+    for domain_id, count in stats.domain_counts.most_common():
+        percentage = (count / total_items) * 100
         table.add_row(domain_id, f"{count:,}", f"{percentage:.1f}%")
 
     console.print(table)
     console.print()
 
     # 2. Items with description or short_description
-    items_with_description = sum(
-        1
-        for item in items
-        if (item.description and item.description.strip())
-        or (item.short_description and item.short_description.strip())
-    )
-
     console.print("[bold]Content Analysis:[/bold]")
     console.print(
-        f"Items with description or short_description: [green]{items_with_description:,}[/green] ([yellow]{(items_with_description / len(items) * 100):.1f}%[/yellow])"
-    )
-
-    # 3. Items with only description
-    items_with_only_description = sum(
-        1
-        for item in items
-        if (item.description and item.description.strip())
-        and not (item.short_description and item.short_description.strip())
-    )
-
-    # 4. Items with only short_description
-    items_with_only_short_description = sum(
-        1
-        for item in items
-        if (item.short_description and item.short_description.strip())
-        and not (item.description and item.description.strip())
-    )
-
-    # 5. Items with both descriptions
-    items_with_both_descriptions = sum(
-        1
-        for item in items
-        if (item.description and item.description.strip())
-        and (item.short_description and item.short_description.strip())
+        f"Items with description or short_description: [green]{stats.items_with_description:,}[/green] ([yellow]{(stats.items_with_description / total_items * 100):.1f}%[/yellow])"
     )
 
+    # 3-5. Items with only one or both descriptions
     console.print(
-        f"Items with only description: [cyan]{items_with_only_description:,}[/cyan] ([yellow]{(items_with_only_description / len(items) * 100):.1f}%[/yellow])"
+        f"Items with only description: [cyan]{stats.items_with_only_description:,}[/cyan] ([yellow]{(stats.items_with_only_description / total_items * 100):.1f}%[/yellow])"
     )
     console.print(
-        f"Items with only short_description: [cyan]{items_with_only_short_description:,}[/cyan] ([yellow]{(items_with_only_short_description / len(items) * 100):.1f}%[/yellow])"
+        f"Items with only short_description: [cyan]{stats.items_with_only_short_description:,}[/cyan] ([yellow]{(stats.items_with_only_short_description / total_items * 100):.1f}%[/yellow])"
     )
     console.print(
-        f"Items with both descriptions: [cyan]{items_with_both_descriptions:,}[/cyan] ([yellow]{(items_with_both_descriptions / len(items) * 100):.1f}%[/yellow])"
+        f"Items with both descriptions: [cyan]{stats.items_with_both_descriptions:,}[/cyan] ([yellow]{(stats.items_with_both_descriptions / total_items * 100):.1f}%[/yellow])"
     )
 
     # 6. Items with keywords
-    items_with_keywords = sum(
-        1 for item in items if item.keywords and item.keywords.strip()
-    )
-
     console.print(
-        f"Items with keywords: [green]{items_with_keywords:,}[/green] ([yellow]{(items_with_keywords / len(items) * 100):.1f}%[/yellow])"
+        f"Items with keywords: [green]{stats.items_with_keywords:,}[/green] ([yellow]{(stats.items_with_keywords / total_items * 100):.1f}%[/yellow])"
     )
 
     # 7. Items with permalink
-    items_with_permalink = sum(1 for item in items if item.permalink)
     console.print(
-        f"Items with permalink: [green]{items_with_permalink:,}[/green] ([yellow]{(items_with_permalink / len(items) * 100):.1f}%[/yellow])"
+        f"Items with permalink: [green]{stats.items_with_permalink:,}[/green] ([yellow]{(stats.items_with_permalink / total_items * 100):.1f}%[/yellow])"
     )
 
     # 8. Attribute statistics
-    total_attributes = sum(len(item.attributes) for item in items)
-    items_with_attributes = sum(1 for item in items if item.attributes)
-    avg_attributes_per_item = total_attributes / len(items) if items else 0
+    avg_attributes_per_item = stats.total_attributes / total_items if total_items else 0
 
     console.print("\n[bold]Structured Data Analysis:[/bold]")
     console.print(
-        f"Items with attributes: [green]{items_with_attributes:,}[/green] ([yellow]{(items_with_attributes / len(items) * 100):.1f}%[/yellow])"
+        f"Items with attributes: [green]{stats.items_with_attributes:,}[/green] ([yellow]{(stats.items_with_attributes / total_items * 100):.1f}%[/yellow])"
     )
     console.print(
-        f"Total attributes across all items: [cyan]{total_attributes:,}[/cyan]"
+        f"Total attributes across all items: [cyan]{stats.total_attributes:,}[/cyan]"
     )
     console.print(
         f"Average attributes per item: [cyan]{avg_attributes_per_item:.1f}[/cyan]"
     )
 
     # 9. Main features statistics
-    total_main_features = sum(len(item.main_features) for item in items)
-    items_with_main_features = sum(1 for item in items if item.main_features)
-    avg_main_features_per_item = total_main_features / len(items) if items else 0
+    avg_main_features_per_item = (
+        stats.total_main_features / total_items if total_items else 0
+    )
 
     console.print(
-        f"Items with main features: [green]{items_with_main_features:,}[/green] ([yellow]{(items_with_main_features / len(items) * 100):.1f}%[/yellow])"
+        f"Items with main features: [green]{stats.items_with_main_features:,}[/green] ([yellow]{(stats.items_with_main_features / total_items * 100):.1f}%[/yellow])"
     )
     console.print(
-        f"Total main features across all items: [cyan]{total_main_features:,}[/cyan]"
+        f"Total main features across all items: [cyan]{stats.total_main_features:,}[/cyan]"
     )
     console.print(
         f"Average main features per item: [cyan]{avg_main_features_per_item:.1f}[/cyan]"
     )
 
     # 10. Family name analysis
-    family_counts = Counter(item.family_name for item in items)
-    top_families = family_counts.most_common(10)
+    top_families = stats.family_counts.most_common(10)
 
     console.print("\n[bold]Top 10 Product Families:[/bold]")
     family_table = Table(show_header=True, header_style="bold magenta")
@@ -278,105 +324,90 @@ def _calculate_and_display_statistics(
     family_table.add_column("Percentage", justify="right", style="yellow")
 
     for family_name, count in top_families:
-        percentage = (count / len(items)) * 100
+        percentage = (count / total_items) * 100
         family_table.add_row(family_name, f"{count:,}", f"{percentage:.1f}%")
 
     console.print(family_table)
 
-    # 11. Text content richness analysis
-    items_with_any_text = sum(
-        1
-        for item in items
-        if any(
-            [
-                item.description and item.description.strip(),
-                item.short_description and item.short_description.strip(),
-                item.keywords and item.keywords.strip(),
-            ]
-        )
+    # 11. Text content richness analysis, with the average text length taken
+    # over the items that have text
+    avg_text_length = (
+        stats.total_text_length / stats.items_with_any_text
+        if stats.items_with_any_text
+        else 0
     )
 
-    # Calculate average text length for items that have text
-    text_lengths = []
-    for item in items:
-        total_text = ""
-        if item.description:
-            total_text += item.description
-        if item.short_description:
-            total_text += " " + item.short_description
-        if item.keywords:
-            total_text += " " + item.keywords
-        if total_text.strip():
-            text_lengths.append(len(total_text.strip()))
-
-    avg_text_length = sum(text_lengths) / len(text_lengths) if text_lengths else 0
-
     console.print("\n[bold]Text Content Summary:[/bold]")
     console.print(
-        f"Items with any text content: [green]{items_with_any_text:,}[/green] ([yellow]{(items_with_any_text / len(items) * 100):.1f}%[/yellow])"
+        f"Items with any text content: [green]{stats.items_with_any_text:,}[/green] ([yellow]{(stats.items_with_any_text / total_items * 100):.1f}%[/yellow])"
     )
     console.print(f"Average text length (chars): [cyan]{avg_text_length:.0f}[/cyan]")
     console.print(
-        f"Text content completeness score: [bold green]{((items_with_any_text / len(items)) * 100):.1f}%[/bold green]"
+        f"Text content completeness score: [bold green]{((stats.items_with_any_text / total_items) * 100):.1f}%[/bold green]"
     )
 
 
 async def _collect_categories_with_subcategories_and_attributes(
     session: OAuth2Session,
+    progress: Progress,
 ) -> list[tuple[CategoryDetail, list[tuple[ChildCategory, list[CategoryAttribute]]]]]:
     """Collect all categories with their subcategories and attributes."""
     categories = await get_categories(session, SiteId.BRAZIL)
 
-    with Progress(
-        SpinnerColumn(),
-        TextColumn("[progress.description]{task.description}"),
-        TimeElapsedColumn(),
-    ) as progress:
-        main_task = progress.add_task("Collecting categories...", total=len(categories))
-
-        # Step 1: Get all category details in parallel
-        async with asyncio.TaskGroup() as tg:
-            category_tasks = [
-                tg.create_task(get_category(session, category_ref.id))
-                for category_ref in categories
-            ]
-
-        # Step 2: Process each category and get child attributes in parallel
-        result: list[
-            tuple[CategoryDetail, list[tuple[ChildCategory, list[CategoryAttribute]]]]
-        ] = []
-
-        for category_ref, category_task in zip(categories, category_tasks, strict=True):
-            category = category_task.result()
-            subcategories: list[tuple[ChildCategory, list[CategoryAttribute]]] = []
-
-            if category.children_categories:
-                child_task = progress.add_task(
-                    f"[cyan]Collecting children of {category_ref.name}[/cyan]",
-                    total=len(category.children_categories),
+    main_task = progress.add_task("Collecting categories...", total=len(categories))
+    children_task = progress.add_task(
+        "[cyan]Collecting child category attributes...[/cyan]", total=0
+    )
+    # Requests for child category attributes share a bound on how many are in
+    # flight, to stay within the API rate limits
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_CATEGORY_REQUESTS)
+    attribute_tasks: dict[str, asyncio.Task[list[CategoryAttribute]]] = {}
+
+    async def get_child_attributes(
+        child_category: ChildCategory,
+    ) -> list[CategoryAttribute]:
+        async with semaphore:
+            attributes = await get_category_attributes(session, child_category.id)
+        progress.update(children_task, advance=1)
+        return attributes
+
+    async def get_category_and_start_children(category_id: str) -> CategoryDetail:
+        category = await get_category(session, category_id)
+        progress.update(main_task, advance=1)
+
+        # Start fetching the attributes of the children right away, without
+        # waiting for the other categories. Children that appear under more
+        # than one category are fetched once.
+        for child_category in category.children_categories:
+            if child_category.id not in attribute_tasks:
+                attribute_tasks[child_category.id] = tg.create_task(
+                    get_child_attributes(child_category)
                 )
+        progress.update(children_task, total=len(attribute_tasks))
+        return category
 
-                # Get all child category attributes in parallel
-                async with asyncio.TaskGroup() as child_tg:
-                    attribute_tasks = [
-                        child_tg.create_task(
-                            get_category_attributes(session, child_category.id)
-                        )
-                        for child_category in category.children_categories
-                    ]
+    # Steps 1 and 2: Get all category details in parallel, and the attributes of
+    # each category's children as soon as its details arrive
+    async with asyncio.TaskGroup() as tg:
+        category_tasks = [
+            tg.create_task(get_category_and_start_children(category_ref.id))
+            for category_ref in categories
+        ]
 
-                # Combine children with their attributes
-                for child_category, attribute_task in zip(
-                    category.children_categories, attribute_tasks, strict=True
-                ):
-                    attributes = attribute_task.result()
-                    subcategories.append((child_category, attributes))
-                    progress.update(child_task, advance=1)
+    progress.remove_task(children_task)
 
-                progress.remove_task(child_task)
+    # Step 3: Combine categories with their children and attributes
+    result: list[
+        tuple[CategoryDetail, list[tuple[ChildCategory, list[CategoryAttribute]]]]
+    ] = []
 
-            result.append((category, subcategories))
-            progress.update(main_task, advance=1)
+    for category_task in category_tasks:
+        category = category_task.result()
+        subcategories = [
+            (child_category, attribute_tasks[child_category.id].result())
+            for child_category in category.children_categories
+        ]
+        result.append((category, subcategories))
 
     return result
 
@@ -388,38 +419,27 @@ def _validate_all_categories_in_config_exist(
     ],
 ) -> None:
     """Validate that all categories in the config exist in the API response list."""
-    # Build lookup dictionaries using IDs as keys
-    api_categories_by_id: dict[str, CategoryDetail | ChildCategory] = {}
+    # Build a lookup of category names using IDs as keys
+    api_category_names_by_id: dict[str, str] = {}
 
     for ref_category, subcategories in categories:
-        api_categories_by_id[ref_category.id] = ref_category
+        api_category_names_by_id[ref_category.id] = ref_category.name
         for subcategory, _ in subcategories:
-            api_categories_by_id[subcategory.id] = subcategory
+            api_category_names_by_id[subcategory.id] = subcategory.name
 
     config_categories = [*config.categories.include, *config.categories.exclude]
 
-    with Progress(
-        SpinnerColumn(),
-        TextColumn("[progress.description]{task.description}"),
-        TimeElapsedColumn(),
-    ) as progress:
-        task = progress.add_task(
-            "Validating config categories exist...", total=len(config_categories)
-        )
-
-        for category_config in config_categories:
-            if category_config.id not in api_categories_by_id:
-                raise ValueError(
-                    f"Category {category_config.id} '{category_config.name}' not found in categories"
-                )
-
-            category = api_categories_by_id[category_config.id]
-            if category.name != category.name:
-                raise ValueError(
-                    f"Category {category.id} has different name in config: {category.name} != {category.name}"
-                )
+    for category_config in config_categories:
+        api_category_name = api_category_names_by_id.get(category_config.id)
+        if api_category_name is None:
+            raise ValueError(
+                f"Category {category_config.id} '{category_config.name}' not found in categories"
+            )
 
-            progress.update(task, advance=1)
+        if api_category_name != category_config.name:
+            raise ValueError(
+                f"Category {category_config.id} has different name in config: {category_config.name} != {api_category_name}"
+            )
 
 
 def _validate_all_categories_are_in_config(
@@ -429,35 +449,26 @@ def _validate_all_categories_are_in_config(
     ],
 ) -> None:
     """Validate that all categories in the config are in the categories list, either included or excluded."""
-    config_categories_ids = {
-        category.id
-        for category in (*config.categories.include, *config.categories.exclude)
+    config_categories_ids = (
+        config.categories.get_include_ids() | config.categories.get_exclude_ids()
+    )
+
+    # Extract the names of all categories from the API data, by ID
+    api_category_names_by_id = {
+        category.id: category.name for category, _ in categories
     }
 
-    # Extract all categories from the API data
-    api_categories_list = [category for category, _ in categories]
-
-    with Progress(
-        SpinnerColumn(),
-        TextColumn("[progress.description]{task.description}"),
-        TimeElapsedColumn(),
-    ) as progress:
-        task = progress.add_task(
-            "Validating all API categories are in config...",
-            total=len(api_categories_list),
+    missing_categories = [
+        (category_id, api_category_names_by_id[category_id])
+        for category_id in sorted(
+            api_category_names_by_id.keys() - config_categories_ids
         )
+    ]
 
-        missing_categories: list[tuple[str, str]] = []
-
-        for api_category in api_categories_list:
-            if api_category.id not in config_categories_ids:
-                missing_categories.append((api_category.id, api_category.name))
-            progress.update(task, advance=1)
-
-        if missing_categories:
-            raise ValueError(
-                f"The following categories were not found in the config - please either include or exclude them:\n{pformat(missing_categories)}"
-            )
+    if missing_categories:
+        raise ValueError(
+            f"The following categories were not found in the config - please either include or exclude them:\n{pformat(missing_categories)}"
+        )
 
 
 async def _generate_input_dataset_items(
@@ -471,17 +482,24 @@ async def _generate_input_dataset_items(
     """Build a dataset of products from configured categories and queries - elegant async version."""
 
     # Collect all queries
-    all_queries = [
-        query
-        for category in collector_config.categories.include
-        for query in category.queries
-    ] + list(collector_config.extra_queries)
+    all_queries = collector_config.get_all_queries()
 
     logger.info(f"Starting parallel collection from {len(all_queries)} queries")
     logger.info(f"Target size: {target_size:,}")
 
-    # Create async iterators for each query
-    query_iterators = [_items_from_query(session, query=query) for query in all_queries]
+    # Create async iterators for each query, sharing the IDs of the products
+    # already fetched so that overlapping queries do not fetch them again
+    seen_ids: set[str] = set()
+    product_semaphore = asyncio.Semaphore(MAX_CONCURRENT_PRODUCT_REQUESTS)
+    query_iterators = [
+        _items_from_query(
+            session,
+            query=query,
+            seen_ids=seen_ids,
+            product_semaphore=product_semaphore,
+        )
+        for query in all_queries
+    ]
 
     # Interleave results and take exactly target_size items
     if goal == Goal.BALANCE:
@@ -498,74 +516,127 @@ async def _generate_input_dataset_items(
         yield item
         count += 1
 
-        # Update main progress with current count
-        progress_tracker.update(
-            main_progress_task,
-            description=f"[green]Collecting items... ({count:,} / {target_size:,})[/green]",
-        )
+        # Advancing is cheap, but formatting the description is not, so the
+        # count in it is only refreshed every few items and at the end
+        progress_tracker.update(main_progress_task, advance=1)
+        if count % PROGRESS_DESCRIPTION_INTERVAL == 0:
+            _update_main_progress_description(
+                progress_tracker, main_progress_task, count, target_size
+            )
+
+    _update_main_progress_description(
+        progress_tracker, main_progress_task, count, target_size
+    )
 
     print(f"[bold green]Collection complete: {count:,} items[/bold green]")
 
 
+def _update_main_progress_description(
+    progress_tracker: Progress,
+    main_progress_task: TaskID,
+    count: int,
+    target_size: int,
+) -> None:
+    progress_tracker.update(
+        main_progress_task,
+        description=f"[green]Collecting items... ({count:,} / {target_size:,})[/green]",
+    )
+
+
 async def _items_from_query(
     session: OAuth2Session,
     query: str,
+    seen_ids: set[str],
+    product_semaphore: asyncio.Semaphore,
 ) -> AsyncIterator[HazmatInputItem]:
-    """Generate items from a single query - simple async iterator."""
+    """Generate items from a single query - simple async iterator.
+
+    Products whose ID is in `seen_ids` are skipped, and the IDs of the products
+    fetched by this query are added to it.
+    """
     consecutive_failures = 0
     items_collected = 0
 
-    # Process each result
-    async for search_response in search_products_paginated(
-        session,
-        SiteId.BRAZIL,
-        query=query,
-        limit=QUERY_SIZE_LIMIT,
+    # Process each result, searching for the next page while the products of
+    # the current one are being fetched
+    async for search_response in aprefetch(
+        search_products_paginated(
+            session,
+            SiteId.BRAZIL,
+            query=query,
+            limit=QUERY_SIZE_LIMIT,
+        )
     ):
-        async with asyncio.TaskGroup() as tg:
-            get_product_tasks = [
-                tg.create_task(_maybe_get_product(session, search_result.id))
-                for search_result in search_response.results
-            ]
-
-        for search_result, product_task in zip(
-            search_response.results,
-            get_product_tasks,
-            strict=True,
-        ):
-            if consecutive_failures >= MAX_CONSECUTIVE_FAILURES:
-                raise ValueError(
-                    f"Query '{query}': stopping due to {consecutive_failures} consecutive failures"
+        new_results: list[SearchResult] = []
+        for search_result in search_response.results:
+            if search_result.id not in seen_ids:
+                seen_ids.add(search_result.id)
+                new_results.append(search_result)
+
+        # Items are yielded in the order their products arrive, so a slow
+        # product does not hold back the rest of the page. The number of product
+        # requests in flight is bounded across all queries by `product_semaphore`.
+        get_product_tasks = [
+            asyncio.create_task(
+                _maybe_get_search_result_product(
+                    session, search_result, product_semaphore
                 )
-
-            try:
-                product = product_task.result()
-                if product is None:
+            )
+            for search_result in new_results
+        ]
+
+        try:
+            for next_product in asyncio.as_completed(get_product_tasks):
+                if consecutive_failures >= MAX_CONSECUTIVE_FAILURES:
+                    raise ValueError(
+                        f"Query '{query}': stopping due to {consecutive_failures} consecutive failures"
+                    )
+
+                try:
+                    search_result, product = await next_product
+                    if product is None:
+                        continue
+
+                    item = HazmatInputItem.from_search_result_and_product(
+                        search_result,
+                        product,
+                    )
+                    yield item
+                    items_collected += 1
+                    consecutive_failures = 0
+
+                except HTTPError as e:
+                    logger.error(f"HTTP error in query '{query}': {e}")
+                    consecutive_failures += 1
                     continue
+        finally:
+            # Stop fetching the rest of the page if the consumer stops early, and
+            # wait for the fetches to finish so that no exception goes unretrieved
+            for product_task in get_product_tasks:
+                product_task.cancel()
+            await asyncio.gather(*get_product_tasks, return_exceptions=True)
 
-                item = HazmatInputItem.from_search_result_and_product(
-                    search_result,
-                    product,
-                )
-                yield item
-                items_collected += 1
-                consecutive_failures = 0
+    logger.info(f"Query '{query}' completed: {items_collected:,} items collected")
 
-            except HTTPError as e:
-                logger.error(f"HTTP error in query '{query}': {e}")
-                consecutive_failures += 1
-                continue
 
-    logger.info(f"Query '{query}' completed: {items_collected:,} items collected")
+async def _maybe_get_search_result_product(
+    session: OAuth2Session,
+    search_result: SearchResult,
+    semaphore: asyncio.Semaphore,
+) -> tuple[SearchResult, Product | None]:
+    """Get the product of a search result, or None if it's not found."""
+    return search_result, await _maybe_get_product(session, search_result.id, semaphore)
 
 
 async def _maybe_get_product(
     session: OAuth2Session,
     product_id: str,
+    semaphore: asyncio.Semaphore,
 ) -> Product | None:
     """Get a product from the API, but return None if it's not found."""
     try:
-        return await get_product(session, product_id)
+        async with semaphore:
+            return await get_product(session, product_id)
     except HTTPError as e:
         logger.error(f"HTTP error in product '{product_id}': {e}")
         return None
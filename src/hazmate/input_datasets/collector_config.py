@@ -72,6 +72,17 @@ class CollectorConfig(BaseModel):
         ),
     ] = ()
 
+    def get_all_queries(self) -> tuple[str, ...]:
+        """Get the queries of all included categories, followed by the extra queries."""
+        return (
+            *(
+                query
+                for category in self.categories.include
+                for query in category.queries
+            ),
+            *self.extra_queries,
+        )
+
     @classmethod
     def from_yaml(cls, path: Path) -> Self:
         with open(path, "r") as f:
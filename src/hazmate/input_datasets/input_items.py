@@ -1,6 +1,7 @@
-from typing import Self
+from collections.abc import Mapping
+from typing import Any, Self
 
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict, PrivateAttr
 from pydantic import HttpUrl as Url
 
 from hazmate.input_datasets.queries.product import (
@@ -20,7 +21,7 @@ class InputDatasetAttribute(BaseModel):
 
     @classmethod
     def from_api_attribute(cls, attribute: Attribute) -> Self:
-        return cls(
+        return cls.model_construct(
             id=attribute.id,
             name=attribute.name,
             value_name=attribute.value_name,
@@ -38,7 +39,7 @@ class InputDatasetMainFeature(BaseModel):
 
     @classmethod
     def from_api_main_feature(cls, main_feature: MainFeature) -> Self:
-        return cls(
+        return cls.model_construct(
             text=main_feature.text,
             type=main_feature.type,
         )
@@ -54,6 +55,8 @@ class HazmatInputItem(BaseModel):
     to get the most comprehensive data for hazmat classification.
     """
 
+    model_config = ConfigDict(frozen=True)
+
     # Product identification
     item_id: str
     name: str
@@ -70,6 +73,9 @@ class HazmatInputItem(BaseModel):
     attributes: tuple[InputDatasetAttribute, ...] = ()
     main_features: tuple[InputDatasetMainFeature, ...] = ()
 
+    # Rendered XML, keyed by `(include_item_id, include_attributes)`
+    _xml_cache: dict[tuple[bool, bool], str] = PrivateAttr(default_factory=dict)
+
     @classmethod
     def from_search_result_and_product(
         cls,
@@ -103,7 +109,9 @@ class HazmatInputItem(BaseModel):
             )
         )
 
-        return cls(
+        # The API responses were validated when they were parsed, so the item is
+        # built without validating the same data again
+        return cls.model_construct(
             item_id=product.id,
             name=product.name,
             domain_id=product.domain_id,  # Should be same in both
@@ -117,12 +125,41 @@ class HazmatInputItem(BaseModel):
             main_features=main_features,
         )
 
+    def without_attributes(self) -> Self:
+        """Get a copy of this item without its attributes and main features."""
+        if not self.attributes and not self.main_features:
+            return self
+
+        return self.model_copy(update={"attributes": (), "main_features": ()})
+
+    def model_copy(
+        self, *, update: Mapping[str, Any] | None = None, deep: bool = False
+    ) -> Self:
+        item = super().model_copy(update=update, deep=deep)
+        # Copies share private attributes with the original, and may have
+        # different fields, so each copy gets its own cache
+        item._xml_cache = {}
+        return item
+
     def get_all_text_content_as_xml(
         self,
         include_item_id: bool = True,
         include_attributes: bool = True,
     ) -> str:
-        """Get all textual content concatenated for analysis."""
+        """Get all textual content concatenated for analysis.
+
+        Items are immutable, so the XML is rendered once per combination of flags
+        and reused by every prompt, token estimate and retry that needs it.
+        """
+        cache_key = (include_item_id, include_attributes)
+        if (xml := self._xml_cache.get(cache_key)) is None:
+            xml = self._xml_cache[cache_key] = self._render_xml(
+                include_item_id=include_item_id,
+                include_attributes=include_attributes,
+            )
+        return xml
+
+    def _render_xml(self, include_item_id: bool, include_attributes: bool) -> str:
         content_parts = ["<item>"]
 
         if include_item_id:
@@ -55,6 +55,38 @@ async def ainterleave_queued(*iters: AsyncIterator[_T]) -> AsyncIterator[_T]:
     await asyncio.gather(*tasks, return_exceptions=True)
 
 
+async def aprefetch(
+    async_iterator: AsyncIterator[_T], size: int = 1
+) -> AsyncIterator[_T]:
+    """Read items ahead of the consumer in a background task.
+
+    Up to `size` items are buffered, so producing the next items overlaps with
+    processing the current one. Exceptions raised by the iterator are re-raised
+    to the consumer, in order.
+    """
+    # Items are wrapped in a tuple to tell them apart from errors and the end
+    queue: asyncio.Queue[tuple[_T] | Exception | None] = asyncio.Queue(maxsize=size)
+
+    async def fill() -> None:
+        try:
+            async for item in async_iterator:
+                await queue.put((item,))
+        except Exception as e:
+            await queue.put(e)
+        else:
+            await queue.put(None)
+
+    task = asyncio.create_task(fill())
+    try:
+        while (entry := await queue.get()) is not None:
+            if isinstance(entry, Exception):
+                raise entry
+            yield entry[0]
+    finally:
+        # Stop reading ahead if the consumer stops early
+        task.cancel()
+
+
 async def aislice(
     async_iterator: AsyncIterator,
     start: int,
@@ -5,16 +5,34 @@ from dataclasses import dataclass
 from types import TracebackType
 from typing import Any, Self
 
+import anyio
 import requests
 from asyncer import asyncify
 from pydantic import HttpUrl, SecretStr
+from requests.adapters import HTTPAdapter
 from requests_oauthlib import OAuth2Session as _OAuth2Session
+from urllib3.util.retry import Retry
 from yarl import URL
 
+# Rate-limited and transient gateway errors are retried with exponential backoff
+# before reaching the caller. The last response is returned instead of raising,
+# so callers still see an `HTTPError` from `raise_for_status` once retries are
+# exhausted.
+_RETRY = Retry(
+    total=3,
+    backoff_factor=0.2,
+    status_forcelist=(429, 502, 503, 504),
+    allowed_methods=frozenset({"GET"}),
+    raise_on_status=False,
+)
+
 
 @dataclass(frozen=True)
 class OAuth2Session:
     session: _OAuth2Session
+    # Requests run in worker threads, which are capped by this limiter rather
+    # than by anyio's default limiter of 40 threads shared with other callers
+    thread_limiter: anyio.CapacityLimiter
 
     @classmethod
     def from_config(
@@ -26,6 +44,7 @@ class OAuth2Session:
         scopes: Iterable[str],
         oauth_token_loader: Callable[[], dict[str, Any] | None],
         oauth_token_saver: Callable[[dict[str, Any]], None],
+        max_connections: int = 64,
     ) -> Self:
         if isinstance(redirect_uri, URL):
             redirect_uri = redirect_uri.human_repr()
@@ -44,15 +63,24 @@ class OAuth2Session:
                 "client_secret": client_secret.get_secret_value(),
             },
         )
+        # Requests run concurrently in worker threads. The default pool keeps
+        # only 10 connections per host, so connections beyond that would be
+        # discarded after each request and reopened with a new TLS handshake
+        session.mount(
+            "https://",
+            HTTPAdapter(pool_maxsize=max_connections, max_retries=_RETRY),
+        )
 
-        return cls(session)
+        return cls(session, thread_limiter=anyio.CapacityLimiter(max_connections))
 
     async def get(
         self, url: str | URL, params: dict[str, Any] | None = None
     ) -> requests.Response:
         if isinstance(url, URL):
             url = url.human_repr()
-        return await asyncify(self.session.get)(url, params=params)
+        return await asyncify(self.session.get, limiter=self.thread_limiter)(
+            url, params=params
+        )
 
     async def __aenter__(self) -> Self:
         self.session.__enter__()
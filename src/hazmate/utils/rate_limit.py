@@ -0,0 +1,42 @@
+import asyncio
+from dataclasses import dataclass, field
+
+
+@dataclass
+class AsyncRateLimiter:
+    """Limit how often callers may proceed, spreading them evenly over time.
+
+    At most `max_rate` calls to `acquire` return per `time_period` seconds.
+    Each caller reserves the next free slot and sleeps until it is due, so
+    concurrent callers are released one interval apart instead of in bursts.
+    """
+
+    max_rate: float
+    time_period: float = 60.0
+    _next_slot: float = field(default=0.0, init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        if self.max_rate <= 0:
+            raise ValueError(f"max_rate must be positive, got {self.max_rate}")
+        if self.time_period <= 0:
+            raise ValueError(f"time_period must be positive, got {self.time_period}")
+
+    @property
+    def interval(self) -> float:
+        """Seconds between two consecutive slots."""
+        return self.time_period / self.max_rate
+
+    async def acquire(self) -> None:
+        """Wait until the next slot is available."""
+        now = asyncio.get_running_loop().time()
+        slot = max(now, self._next_slot)
+        # Reserve the slot before sleeping so concurrent callers queue up behind it
+        self._next_slot = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    async def __aenter__(self) -> None:
+        await self.acquire()
+
+    async def __aexit__(self, *exc_info: object) -> None:
+        pass
@@ -0,0 +1,184 @@
+from collections import deque
+from pathlib import Path
+
+import pytest
+
+from hazmate.agent import __main__ as agent_main
+from hazmate.agent.__main__ import (
+    _DuplicateTracker,
+    _estimate_item_token_count,
+    _extract_batch,
+    _iter_input_items,
+)
+from hazmate.agent.labeled_items import HazmatLabeledItem
+from hazmate.agent.predictions import HazmatPrediction
+from hazmate.input_datasets.input_items import (
+    HazmatInputItem,
+    InputDatasetAttribute,
+)
+
+
+def make_item(
+    item_id: str, name: str | None = None, attribute_count: int = 0
+) -> HazmatInputItem:
+    """Helper function to create an input item, by default with unique content."""
+    return HazmatInputItem(
+        item_id=item_id,
+        name=name or f"Item {item_id}",
+        domain_id="D",
+        family_name="F",
+        attributes=tuple(
+            InputDatasetAttribute(id=f"A{i}", name=f"Attribute {i}", value_name="Value")
+            for i in range(attribute_count)
+        ),
+    )
+
+
+def label(item: HazmatInputItem, is_hazmat: bool = True) -> HazmatLabeledItem:
+    """Helper function to label an item as the model would."""
+    return HazmatLabeledItem.from_input_and_prediction(
+        input_item=item,
+        prediction=HazmatPrediction(
+            item_id=item.item_id, is_hazmat=is_hazmat, reason="Test"
+        ),
+    )
+
+
+class TestDuplicateTracker:
+    """Test cases for _DuplicateTracker."""
+
+    def test_items_with_the_same_content_are_sent_once(self):
+        """Test that only the first item per content is sent, and duplicates reuse its prediction."""
+        tracker = _DuplicateTracker()
+        items = [make_item("1", "Lighter"), make_item("2", "Lighter"), make_item("3")]
+
+        sent = list(tracker.filter(items))
+        assert [item.item_id for item in sent] == ["1", "3"]
+
+        resolved = tracker.resolve([label(sent[0]), label(sent[1], is_hazmat=False)])
+        assert [result.item_id for result in resolved] == ["2"]
+        assert resolved[0].prediction.item_id == "2"
+        assert resolved[0].prediction.is_hazmat is True
+
+    def test_duplicates_read_after_the_prediction_are_resolved(self):
+        """Test that a duplicate read after its prediction is known is resolved without being sent."""
+        tracker = _DuplicateTracker()
+        (first,) = tracker.filter([make_item("1", "Lighter")])
+        assert tracker.resolve([label(first)]) == []
+
+        assert list(tracker.filter([make_item("2", "Lighter")])) == []
+        assert [result.item_id for result in tracker.resolve([])] == ["2"]
+
+    def test_least_recently_used_predictions_are_evicted(
+        self, monkeypatch: pytest.MonkeyPatch
+    ):
+        """Test that only the most recently used predictions are remembered."""
+        monkeypatch.setattr(agent_main, "_MAX_REMEMBERED_PREDICTIONS", 2)
+        tracker = _DuplicateTracker()
+        sent = list(tracker.filter([make_item("A", "A"), make_item("B", "B")]))
+        tracker.resolve([label(item) for item in sent])
+
+        # Using A's prediction makes B's the least recently used, evicted by C's
+        assert list(tracker.filter([make_item("A2", "A")])) == []
+        sent = list(tracker.filter([make_item("C", "C")]))
+        tracker.resolve([label(item) for item in sent])
+
+        sent = list(tracker.filter([make_item("A3", "A"), make_item("B3", "B")]))
+        assert [item.item_id for item in sent] == ["B3"]
+
+    def test_resume_skips_processed_items_and_their_duplicates(self, tmp_path: Path):
+        """Test that resuming sends a remaining duplicate of a processed item only once."""
+        input_path = tmp_path / "input.jsonl"
+        input_path.write_text(
+            "\n".join(
+                make_item(item_id, "Lighter").model_dump_json()
+                for item_id in ["1", "2", "3", "4"]
+            )
+            + "\n"
+        )
+        tracker = _DuplicateTracker()
+
+        sent = list(tracker.filter(_iter_input_items(input_path, {"1", "2"})))
+        assert [item.item_id for item in sent] == ["3"]
+        assert [result.item_id for result in tracker.resolve([label(sent[0])])] == ["4"]
+
+
+class TestExtractBatch:
+    """Test cases for _extract_batch."""
+
+    def test_items_are_packed_within_the_token_budget(self):
+        """Test that a batch is closed before the first item that does not fit."""
+        items = deque(make_item(str(i)) for i in range(5))
+        item_token_count = _estimate_item_token_count(items[0])
+
+        batch = _extract_batch(
+            items,
+            batch_size=10,
+            max_input_tokens=100 + 3 * item_token_count,
+            prompt_overhead_tokens=100,
+        )
+
+        assert [item.item_id for item in batch] == ["0", "1", "2"]
+        assert [item.item_id for item in items] == ["3", "4"]
+
+    def test_batches_are_capped_at_batch_size(self):
+        """Test that a batch has at most `batch_size` items."""
+        items = deque(make_item(str(i)) for i in range(5))
+
+        batch = _extract_batch(
+            items, batch_size=2, max_input_tokens=100_000, prompt_overhead_tokens=100
+        )
+
+        assert [item.item_id for item in batch] == ["0", "1"]
+
+    def test_boundary_item_keeps_its_attributes(self):
+        """Test that an item overflowing a partly filled batch goes whole into the next one."""
+        small_item = make_item("small")
+        large_item = make_item("large", attribute_count=20)
+        items = deque([small_item, large_item])
+        max_input_tokens = 100 + _estimate_item_token_count(large_item)
+
+        first_batch = _extract_batch(
+            items,
+            batch_size=10,
+            max_input_tokens=max_input_tokens,
+            prompt_overhead_tokens=100,
+        )
+        second_batch = _extract_batch(
+            items,
+            batch_size=10,
+            max_input_tokens=max_input_tokens,
+            prompt_overhead_tokens=100,
+        )
+
+        assert first_batch == [small_item]
+        assert second_batch == [large_item]
+
+    def test_oversized_item_is_sent_without_attributes(self):
+        """Test that an item too large for an empty batch loses its attributes."""
+        large_item = make_item("large", attribute_count=20)
+        items = deque([large_item])
+
+        batch = _extract_batch(
+            items,
+            batch_size=10,
+            max_input_tokens=100 + _estimate_item_token_count(make_item("large")),
+            prompt_overhead_tokens=100,
+        )
+
+        assert [item.item_id for item in batch] == ["large"]
+        assert batch[0].attributes == ()
+
+    def test_item_that_never_fits_is_skipped(self):
+        """Test that an item too large even without attributes is skipped."""
+        items = deque([make_item("large", "Large " * 100), make_item("small")])
+
+        batch = _extract_batch(
+            items,
+            batch_size=10,
+            max_input_tokens=100 + _estimate_item_token_count(make_item("small")),
+            prompt_overhead_tokens=100,
+        )
+
+        assert [item.item_id for item in batch] == ["small"]
+        assert not items
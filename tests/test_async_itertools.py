@@ -4,7 +4,12 @@ from typing import Any
 
 import pytest
 
-from hazmate.utils.async_itertools import ainterleave, ainterleave_queued, aislice
+from hazmate.utils.async_itertools import (
+    ainterleave,
+    ainterleave_queued,
+    aislice,
+    aprefetch,
+)
 
 
 async def async_range(n: int) -> AsyncIterator[int]:
@@ -407,3 +412,49 @@ class TestAinterleaveQueued:
         assert result.count(1) == 3  # 1 appears twice in iter1, once in iter2
         assert result.count(2) == 2  # 2 appears once in each iterator
         assert result.count(3) == 1  # 3 appears once in iter2
+
+
+class TestAprefetch:
+    """Test cases for aprefetch function."""
+
+    @pytest.mark.asyncio
+    async def test_aprefetch_preserves_order(self):
+        """Test that prefetching yields all items in their original order."""
+        result = [item async for item in aprefetch(async_range(5), size=2)]
+
+        assert result == [0, 1, 2, 3, 4]
+
+    @pytest.mark.asyncio
+    async def test_aprefetch_empty_iterator(self):
+        """Test prefetching from an empty iterator."""
+        result = [item async for item in aprefetch(async_range(0))]
+
+        assert result == []
+
+    @pytest.mark.asyncio
+    async def test_aprefetch_reads_ahead_while_consumer_works(self):
+        """Test that the next item is produced while the current one is processed."""
+        loop = asyncio.get_running_loop()
+
+        start = loop.time()
+        async for _ in aprefetch(async_range_with_delay(3, delay=0.05)):
+            await asyncio.sleep(0.05)
+        elapsed = loop.time() - start
+
+        # Sequentially this would take 6 delays; overlapped it takes about 4
+        assert elapsed < 0.25
+
+    @pytest.mark.asyncio
+    async def test_aprefetch_reraises_exception(self):
+        """Test that errors from the iterator reach the consumer after earlier items."""
+
+        async def failing_iterator():
+            yield 1
+            raise ValueError("Test exception")
+
+        result = []
+        with pytest.raises(ValueError, match="Test exception"):
+            async for item in aprefetch(failing_iterator()):
+                result.append(item)
+
+        assert result == [1]
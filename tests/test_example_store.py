@@ -0,0 +1,90 @@
+import pytest
+from langchain_chroma import Chroma
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from hazmate.agent.example_store import ExampleStore
+from hazmate.agent.hazmat_traits import HazmatTrait, KnownHazmatTrait, OtherHazmatTrait
+from hazmate.agent.labeled_items import HazmatLabeledItem
+
+
+@pytest.fixture
+def example_store() -> ExampleStore:
+    """Fixture providing an example store backed by an in-memory vector store."""
+    embedding_function = DeterministicFakeEmbedding(size=8)
+    return ExampleStore(
+        embedding_function=embedding_function,
+        vector_store=Chroma(
+            collection_name="test_example_store", embedding_function=embedding_function
+        ),
+    )
+
+
+def make_labeled_item(traits: list[HazmatTrait]) -> HazmatLabeledItem:
+    """Helper function to create a labeled item with the given traits."""
+    return HazmatLabeledItem(
+        item_id="MLB1",
+        name="Item",
+        domain_id="D",
+        family_name="F",
+        description="",
+        short_description="",
+        keywords="",
+        is_hazmat=bool(traits),
+        traits=traits,
+        reason="Test",
+    )
+
+
+def round_trip(
+    example_store: ExampleStore, traits: list[HazmatTrait]
+) -> list[HazmatTrait]:
+    """Helper function to store traits in document metadata and read them back."""
+    document = example_store._labeled_item_to_document(make_labeled_item(traits))
+    return example_store._metadata_to_labeled_item(document.metadata).traits
+
+
+class TestExampleStoreTraits:
+    """Test cases for storing example traits in document metadata."""
+
+    def test_traits_round_trip_in_order(self, example_store: ExampleStore):
+        """Test that known and other traits are read back in their original order."""
+        traits: list[HazmatTrait] = [
+            KnownHazmatTrait.TOXIC,
+            OtherHazmatTrait(trait="lithium battery"),
+            KnownHazmatTrait.FLAMMABLE,
+            OtherHazmatTrait(trait="aerosol"),
+        ]
+
+        assert round_trip(example_store, traits) == traits
+
+    def test_every_known_trait_round_trips(self, example_store: ExampleStore):
+        """Test that every known trait has a code that round-trips."""
+        for trait in KnownHazmatTrait:
+            assert round_trip(example_store, [trait]) == [trait]
+
+    def test_many_traits_round_trip(self, example_store: ExampleStore):
+        """Test that more traits than fit in the codes still round-trip in order."""
+        traits: list[HazmatTrait] = list(reversed(KnownHazmatTrait))
+
+        assert round_trip(example_store, traits) == traits
+
+    def test_no_traits_round_trip(self, example_store: ExampleStore):
+        """Test that an example without traits reads back without traits."""
+        assert round_trip(example_store, []) == []
+
+    def test_trailing_other_trait_round_trips(self, example_store: ExampleStore):
+        """Test that an other trait at the end of the list is not lost."""
+        traits: list[HazmatTrait] = [OtherHazmatTrait(trait="aerosol")]
+
+        assert round_trip(example_store, traits) == traits
+
+    def test_legacy_traits_string_is_read(self, example_store: ExampleStore):
+        """Test that examples stored with a single traits string are still read."""
+        document = example_store._labeled_item_to_document(make_labeled_item([]))
+        metadata = {**document.metadata, "traits": "corrosive, aerosol"}
+        del metadata["trait_codes"]
+
+        assert example_store._metadata_to_labeled_item(metadata).traits == [
+            KnownHazmatTrait.CORROSIVE,
+            OtherHazmatTrait(trait="aerosol"),
+        ]
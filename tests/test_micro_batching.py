@@ -0,0 +1,87 @@
+import asyncio
+from collections.abc import Sequence
+from typing import Any
+
+import pytest
+
+from hazmate.agent.micro_batching import MicroBatchingHazmatAgent
+from hazmate.agent.predictions import HazmatPrediction
+from hazmate.input_datasets.input_items import HazmatInputItem
+
+
+def make_item(item_id: str) -> HazmatInputItem:
+    """Helper function to create a minimal input item."""
+    return HazmatInputItem(
+        item_id=item_id, name=f"Item {item_id}", domain_id="D", family_name="F"
+    )
+
+
+def make_prediction(item_id: str) -> HazmatPrediction:
+    """Helper function to create a prediction for an item."""
+    return HazmatPrediction(item_id=item_id, is_hazmat=False, reason="Test")
+
+
+class FakeHazmatAgent:
+    """Agent that records the batches it is called with."""
+
+    def __init__(self) -> None:
+        self.batches: list[list[str]] = []
+
+    async def predict_item(
+        self, item: HazmatInputItem, **kwargs: Any
+    ) -> HazmatPrediction:
+        self.batches.append([item.item_id])
+        return make_prediction(item.item_id)
+
+    async def predict_batch(
+        self, items: Sequence[HazmatInputItem], **kwargs: Any
+    ) -> list[HazmatPrediction]:
+        self.batches.append([item.item_id for item in items])
+        return [make_prediction(item.item_id) for item in items]
+
+
+class TestMicroBatchingHazmatAgent:
+    """Test cases for MicroBatchingHazmatAgent."""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_calls_are_batched(self):
+        """Test that concurrent calls are sent as one batch."""
+        fake_agent = FakeHazmatAgent()
+
+        async with MicroBatchingHazmatAgent(
+            agent=fake_agent,
+            max_batch_size=8,
+            max_delay=0.01,
+        ) as agent:
+            predictions = await asyncio.gather(
+                *(agent.predict_item(make_item(str(i))) for i in range(3))
+            )
+
+        assert [prediction.item_id for prediction in predictions] == ["0", "1", "2"]
+        assert fake_agent.batches == [["0", "1", "2"]]
+
+    @pytest.mark.asyncio
+    async def test_aclose_sends_calls_still_being_collected(self):
+        """Test that closing sends the calls not yet dispatched instead of dropping them."""
+        fake_agent = FakeHazmatAgent()
+        agent = MicroBatchingHazmatAgent(
+            agent=fake_agent,
+            max_batch_size=2,
+            max_delay=10,
+        )
+
+        tasks = [
+            asyncio.create_task(agent.predict_item(make_item(str(i)))) for i in range(5)
+        ]
+        await asyncio.sleep(0.01)
+        await agent.aclose()
+
+        predictions = await asyncio.wait_for(asyncio.gather(*tasks), timeout=1)
+        assert [prediction.item_id for prediction in predictions] == [
+            "0",
+            "1",
+            "2",
+            "3",
+            "4",
+        ]
+        assert fake_agent.batches == [["0", "1"], ["2", "3"], ["4"]]
@@ -0,0 +1,47 @@
+from pathlib import Path
+
+from hazmate.agent.prediction_cache import PredictionCache
+from hazmate.agent.predictions import HazmatPrediction
+
+
+def make_prediction(item_id: str, is_hazmat: bool = False) -> HazmatPrediction:
+    """Helper function to create a prediction for an item."""
+    return HazmatPrediction(item_id=item_id, is_hazmat=is_hazmat, reason="Test")
+
+
+class TestPredictionCache:
+    """Test cases for PredictionCache."""
+
+    def test_stored_predictions_are_returned(self, tmp_path: Path):
+        """Test that predictions are returned for stored keys and skipped on a miss."""
+        with PredictionCache.from_path(tmp_path / "cache.sqlite") as cache:
+            cache.set_many({"a": make_prediction("1"), "b": make_prediction("2")})
+
+            assert cache.get_many(["a", "missing"]) == {"a": make_prediction("1")}
+            assert cache.get_many([]) == {}
+
+    def test_predictions_are_replaced(self, tmp_path: Path):
+        """Test that storing a prediction under an existing key replaces it."""
+        with PredictionCache.from_path(tmp_path / "cache.sqlite") as cache:
+            cache.set_many({"a": make_prediction("1")})
+            cache.set_many({"a": make_prediction("1", is_hazmat=True)})
+
+            assert cache.get_many(["a"]) == {"a": make_prediction("1", is_hazmat=True)}
+
+    def test_predictions_persist_across_connections(self, tmp_path: Path):
+        """Test that predictions are still cached after the cache is reopened."""
+        path = tmp_path / "nested" / "cache.sqlite"
+        with PredictionCache.from_path(path) as cache:
+            cache.set_many({"a": make_prediction("1")})
+
+        with PredictionCache.from_path(path) as cache:
+            assert cache.get_many(["a"]) == {"a": make_prediction("1")}
+
+    def test_keys_depend_on_model_prompt_and_content(self):
+        """Test that changing the model, prompt or item content changes the key."""
+        key = PredictionCache.get_key("model", "prompt", "item")
+
+        assert key == PredictionCache.get_key("model", "prompt", "item")
+        assert key != PredictionCache.get_key("other", "prompt", "item")
+        assert key != PredictionCache.get_key("model", "other", "item")
+        assert key != PredictionCache.get_key("model", "prompt", "other")
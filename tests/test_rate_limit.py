@@ -0,0 +1,47 @@
+import asyncio
+
+import pytest
+
+from hazmate.utils.rate_limit import AsyncRateLimiter
+
+
+class TestAsyncRateLimiter:
+    """Test cases for AsyncRateLimiter."""
+
+    @pytest.mark.asyncio
+    async def test_first_acquire_does_not_wait(self):
+        """Test that the first caller proceeds immediately."""
+        limiter = AsyncRateLimiter(max_rate=1, time_period=10)
+        loop = asyncio.get_running_loop()
+
+        start = loop.time()
+        await limiter.acquire()
+
+        assert loop.time() - start < 0.05
+
+    @pytest.mark.asyncio
+    async def test_concurrent_callers_are_spaced_by_interval(self):
+        """Test that concurrent callers are released one interval apart."""
+        limiter = AsyncRateLimiter(max_rate=20, time_period=1)
+        loop = asyncio.get_running_loop()
+        release_times: list[float] = []
+
+        async def caller() -> None:
+            async with limiter:
+                release_times.append(loop.time())
+
+        await asyncio.gather(*(caller() for _ in range(4)))
+
+        gaps = [b - a for a, b in zip(release_times, release_times[1:])]
+        assert len(gaps) == 3
+        assert all(gap >= limiter.interval * 0.9 for gap in gaps)
+
+    def test_invalid_max_rate(self):
+        """Test that a non-positive rate is rejected."""
+        with pytest.raises(ValueError):
+            AsyncRateLimiter(max_rate=0)
+
+    def test_invalid_time_period(self):
+        """Test that a non-positive time period is rejected."""
+        with pytest.raises(ValueError):
+            AsyncRateLimiter(max_rate=1, time_period=0)